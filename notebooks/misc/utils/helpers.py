@@ -1,26 +1,76 @@
 import math
+import numpy as np
 
 def round_sd(number):
     significant_digits = 4
     return round(number, significant_digits - math.floor(math.log10(abs(number))) - 1)
 
+def order_book_sides(sides, market_dp):
+    # levels of all the book sides concatenated (best level first), side i occupying
+    # [offsets[i], offsets[i+1]), with cumulative volume and notional over all of them
+    lengths = [len(levels) for levels in sides]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    prices = np.fromiter((float(lvl.price) for levels in sides for lvl in levels), float, offsets[-1])
+    prices *= 10 ** (-market_dp)
+    volumes = np.fromiter((float(lvl.volume) for levels in sides for lvl in levels), float, offsets[-1])
+    cum_volume = np.concatenate(([0.0], np.cumsum(volumes)))
+    cum_notional = np.concatenate(([0.0], np.cumsum(prices * volumes)))
+    return prices, cum_volume, cum_notional, offsets
+
+def exit_prices(prices, cum_volume, cum_notional, offsets, side, volumes):
+    # average price of filling each (unsigned) volume from the top of its book side with a single
+    # searchsorted over all sides, positions beyond the available depth are filled with the whole side
+    start = offsets[side]
+    stop = offsets[side + 1]
+    volumes = np.minimum(np.abs(volumes), cum_volume[stop] - cum_volume[start])
+    if len(prices) == 0:
+        return np.full(np.shape(volumes), np.nan)
+    target = cum_volume[start] + volumes
+    level = np.clip(np.searchsorted(cum_volume, target, "left") - 1, start, np.maximum(stop - 1, start))
+    level = np.minimum(level, len(prices) - 1)
+    notional = cum_notional[level] - cum_notional[start] + (target - cum_volume[level]) * prices[level]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(volumes > 0, notional / volumes, np.nan)
+
+def positions_per_book(positions, n_books):
+    # a single set of positions is used for every book, otherwise one row per book
+    positions = np.asarray(positions, dtype=float)
+    if positions.ndim < 2:
+        positions = positions.reshape(1, -1)
+    return np.broadcast_to(positions, (n_books, positions.shape[1]))
+
+def calculate_exit_prices_for_books(order_books, positions, market_dp):
+    '''
+    Exit prices of positions against a sequence of order-book snapshots, returned with shape
+    (number of books, number of positions). positions is either one set for all the books or one
+    row per book. Longs exit against the buy side and shorts against the sell side, all
+    (snapshot, position) pairs are evaluated together.
+    '''
+    positions = positions_per_book(positions, len(order_books))
+    sides = [book.buy for book in order_books] + [book.sell for book in order_books]
+    book = np.arange(len(order_books)).reshape(-1, 1)
+    side = np.where(positions > 0, book, book + len(order_books))
+    ret = exit_prices(*order_book_sides(sides, market_dp), side, positions)
+    return np.where(positions == 0, np.nan, ret)
+
+def calculate_exit_prices(order_book, positions, market_dp):
+    positions = np.asarray(positions, dtype=float)
+    return calculate_exit_prices_for_books([order_book], positions.reshape(1, -1), market_dp).reshape(positions.shape)
+
 def calculate_exit_price(order_book, position, market_dp):
-    levels = order_book.sell
-    if position > 0:
-        levels = order_book.buy
-    p = position
-    v = 0
-    exit_price = 0
-    for lvl in levels:
-        x = lvl.volume
-        if lvl.volume > p:
-            x = p
-        exit_price += x*float(lvl.price)*10**(-market_dp)
-        v+=x
-        p-=x
-        if p <= 0:
-            break
-    return exit_price / v
+    return calculate_exit_prices(order_book, [position], market_dp)[0]
+
+def calculate_slippages_per_unit_for_books(mark_prices, order_books, open_volumes, market_dp):
+    # one mark price per book, open volumes as in calculate_exit_prices_for_books
+    open_volumes = positions_per_book(open_volumes, len(order_books))
+    exit_price = calculate_exit_prices_for_books(order_books, open_volumes, market_dp)
+    mark_prices = np.reshape(np.asarray(mark_prices, dtype=float), (-1, 1))
+    return np.where(open_volumes == 0, 0, np.sign(open_volumes) * (mark_prices - exit_price))
+
+def calculate_slippages_per_unit(mark_price, order_book, open_volumes, market_dp):
+    open_volumes = np.asarray(open_volumes, dtype=float)
+    return calculate_slippages_per_unit_for_books(
+        [mark_price], [order_book], open_volumes.reshape(1, -1), market_dp).reshape(open_volumes.shape)
 
 def calculate_slippage_per_unit(mark_price, order_book, open_volume, market_dp):
     if open_volume==0:
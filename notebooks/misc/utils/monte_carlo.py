@@ -0,0 +1,97 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from utils.risk_models import log_normal_constants, risk_factors, validate_parameters
+
+
+def simulate_risk_factors(
+    mu, sigma, lambd, tau, draws=10**8, chunk_size=10**6, seed=None
+):
+    """
+    Monte Carlo estimate of the long and short risk factors (1 - ES of the lower lambd tail and
+    ES of the upper lambd tail - 1, relative to the current price) from log-normal draws generated
+    chunk_size at a time, so memory does not grow with the number of draws.
+    Returns the two estimates and their standard errors.
+    """
+    validate_parameters(sigma, lambd, tau)
+    (
+        sigmaBar,
+        muBar,
+        _,
+        quantileForLambda,
+        quantileForOneMinusLambda,
+    ) = log_normal_constants(mu, sigma, lambd, tau)
+    rng = np.random.default_rng(seed)
+    z = np.empty(chunk_size)
+    # count, sum and sum of squares of the draws in the lower and upper tails
+    sums = np.zeros(6)
+    remaining = draws
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        rng.standard_normal(out=z[:n])
+        # tails are defined on z as the exp transform is monotone
+        lower = np.exp(muBar + sigmaBar * z[:n][z[:n] <= quantileForLambda])
+        upper = np.exp(muBar + sigmaBar * z[:n][z[:n] >= quantileForOneMinusLambda])
+        sums += [
+            len(lower),
+            lower.sum(),
+            np.dot(lower, lower),
+            len(upper),
+            upper.sum(),
+            np.dot(upper, upper),
+        ]
+        remaining -= n
+    counts, totals, squares = sums[0::3], sums[1::3], sums[2::3]
+    lowerEs, upperEs = totals / counts
+    stderrs = np.sqrt(np.maximum(squares / counts - (totals / counts) ** 2, 0) / counts)
+    return 1.0 - lowerEs, upperEs - 1.0, stderrs[0], stderrs[1]
+
+
+def simulate_risk_factors_task(args):
+    return simulate_risk_factors(*args)
+
+
+def validate_risk_factors(
+    mu,
+    sigmas,
+    taus,
+    lambds,
+    draws=10**8,
+    chunk_size=10**6,
+    seed=None,
+    max_workers=None,
+):
+    """
+    Compares the closed-form LogNormal risk factors with Monte Carlo estimates over the grid of
+    (sigma, tau, lambd), one process pool task per grid point (serially when max_workers is 1).
+    Each grid point gets an independent stream spawned from seed, so results are reproducible.
+    """
+    sigma, tau, lambd = (
+        a.ravel() for a in np.meshgrid(sigmas, taus, lambds, indexing="ij")
+    )
+    long, short = risk_factors(mu, sigma, lambd, tau)
+    seeds = np.random.SeedSequence(seed).spawn(len(sigma))
+    tasks = [
+        (mu, s, l, t, draws, chunk_size, ss)
+        for s, t, l, ss in zip(sigma, tau, lambd, seeds)
+    ]
+    if max_workers == 1:
+        results = list(map(simulate_risk_factors_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(simulate_risk_factors_task, tasks))
+    mcLong, mcShort, longStderr, shortStderr = (
+        np.array(results, dtype=float).reshape(-1, 4).T
+    )
+    return {
+        "sigma": sigma,
+        "tau": tau,
+        "lambd": lambd,
+        "long": long,
+        "short": short,
+        "mc_long": mcLong,
+        "mc_short": mcShort,
+        "long_stderr": longStderr,
+        "short_stderr": shortStderr,
+        "long_deviation": mcLong - long,
+        "short_deviation": mcShort - short,
+    }
@@ -0,0 +1,79 @@
+import numpy as np
+from scipy.stats import norm
+from utils.risk_models import parameter_cache
+
+
+def bound_factors(mu, sigma, year_fraction, probability_level):
+    """
+    Lower and upper price monitoring bounds as multiples of the reference price, i.e. the
+    (1-p)/2 and (1+p)/2 quantiles of the log-normal price after year_fraction. All arguments broadcast together.
+    """
+    muBar = (mu - 0.5 * np.multiply(sigma, sigma)) * year_fraction
+    sigmaBar = np.multiply(sigma, np.sqrt(year_fraction))
+    q = np.divide(np.subtract(1.0, probability_level), 2)
+    return (
+        np.exp(muBar + sigmaBar * norm.ppf(q))[()],
+        np.exp(muBar + sigmaBar * norm.ppf(np.subtract(1.0, q)))[()],
+    )
+
+
+def cached_bound_factors(
+    mu: float, sigma: float, year_fraction: float, probability_level: float
+):
+    """
+    bound_factors for a single parameter tuple, with the quantiles taken from the shared risk model
+    cache (the bounds are its lambd = (1-p)/2 and 1-lambd quantiles over tau = year_fraction)
+    """
+    (
+        sigmaBar,
+        muBar,
+        _,
+        quantileForLambda,
+        quantileForOneMinusLambda,
+    ) = parameter_cache.constants(
+        mu, sigma, (1.0 - probability_level) / 2, year_fraction
+    )
+    return float(np.exp(muBar + sigmaBar * quantileForLambda)), float(
+        np.exp(muBar + sigmaBar * quantileForOneMinusLambda)
+    )
+
+
+def price_monitoring_bounds(
+    reference_price, year_fraction, probability_level, mu, sigma
+):
+    """
+    Min and max valid prices for arrays of reference prices, horizons, probability levels and
+    model parameters broadcast together.
+    """
+    down, up = bound_factors(mu, sigma, year_fraction, probability_level)
+    return np.multiply(reference_price, down)[()], np.multiply(reference_price, up)[()]
+
+
+def market_bounds(
+    reference_prices,
+    year_fraction: float,
+    probability_level: float,
+    mu: float,
+    sigma: float,
+):
+    """
+    Min and max valid prices for every reference price update of a market with fixed parameters,
+    the quantiles are only evaluated once per parameter tuple.
+    """
+    down, up = cached_bound_factors(mu, sigma, year_fraction, probability_level)
+    return (
+        np.multiply(reference_prices, down)[()],
+        np.multiply(reference_prices, up)[()],
+    )
+
+
+def price_density(prices, reference_price, year_fraction, mu, sigma):
+    """
+    Log-normal density of the price after year_fraction, broadcast like price_monitoring_bounds.
+    """
+    prices = np.asarray(prices, dtype=float)
+    m = np.log(reference_price) + (mu - 0.5 * np.multiply(sigma, sigma)) * year_fraction
+    sigmaBar = np.multiply(sigma, np.sqrt(year_fraction))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        density = norm.pdf((np.log(prices) - m) / sigmaBar) / (sigmaBar * prices)
+    return np.where(prices > 0, density, 0.0)[()]
@@ -1,38 +1,164 @@
 from typing import Any
+from collections import OrderedDict
 import numpy as np
 from scipy.stats import norm
 
+
+def validate_parameters(sigma, lambd, tau):
+    if (np.any(np.less(tau, 0)) or np.any(np.less_equal(sigma, 0))
+            or np.any(np.less(lambd, 0.0)) or np.any(np.greater(lambd, 1.0))):
+        raise ValueError(
+            "Time and volatility parameter should be strictly +ve and lambd must be between 0 and 1. ")
+
+
+def log_normal_constants(mu, sigma, lambd, tau):
+    '''
+    Parameter dependent terms of the log-normal risk model:
+    sigmaBar, muBar, the expected shortfall scaling factor and the quantiles for lambd and 1-lambd.
+    The scaling is exp(muBar + sigmaBar^2/2) / lambd, as the partial expectation of the price over
+    the lower tail is E[S; Z <= q] = exp(muBar + sigmaBar^2/2) * N(q - sigmaBar).
+    '''
+    sigmaBar = np.sqrt(tau) * sigma
+    muBar = (mu - 0.5*np.multiply(sigma, sigma)) * tau
+    esScaling = np.divide(1, lambd)*np.exp(muBar + sigmaBar*sigmaBar*0.5)
+    return sigmaBar, muBar, esScaling, norm.ppf(lambd), norm.ppf(np.subtract(1.0, lambd))
+
+
+def risk_factors(mu, sigma, lambd, tau):
+    '''
+    Long and short risk factors for arrays of (mu, sigma, lambd, tau) broadcast together,
+    e.g. one entry per market.
+    '''
+    validate_parameters(sigma, lambd, tau)
+    sigmaBar, _, esScaling, quantileForLambda, quantileForOneMinusLambda = log_normal_constants(mu, sigma, lambd, tau)
+    riskFactorLong = -esScaling * norm.cdf(quantileForLambda-sigmaBar) + 1.0
+    riskFactorShort = esScaling * (1.0 - norm.cdf(quantileForOneMinusLambda-sigmaBar)) - 1.0
+    return riskFactorLong, riskFactorShort
+
+
+class ParameterCache:
+    '''
+    Bounded LRU cache of the log-normal constants and of the risk factors, each keyed on
+    (mu, sigma, lambd, tau) separately so a lookup only computes what it asks for, with hit and miss counts.
+    '''
+
+    def __init__(self, maxsize:int=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind:str, compute, mu:float, sigma:float, lambd:float, tau:float):
+        key = (kind, float(mu), float(sigma), float(lambd), float(tau))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = compute(*key[1:])
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def constants(self, mu:float, sigma:float, lambd:float, tau:float):
+        return self.get("constants", log_normal_constants, mu, sigma, lambd, tau)
+
+    def risk_factors(self, mu:float, sigma:float, lambd:float, tau:float):
+        return self.get("risk_factors", risk_factors, mu, sigma, lambd, tau)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# shared by LogNormal and the price monitoring bounds
+parameter_cache = ParameterCache()
+
+
+def prob_of_trading(mu, sigma, tau, mid, level):
+    '''
+    Probability of trading at each price level for the given mid price(s), all arguments broadcast together.
+    '''
+    transLevel = (np.log(np.divide(level, mid)) - (mu - 0.5*np.multiply(sigma, sigma))*tau) / (sigma*np.sqrt(tau))
+    return np.where(np.less(mid, level), 1.0 - norm.cdf(transLevel), norm.cdf(transLevel))[()]
+
+
+class ProbOfTradingTable:
+    '''
+    Precomputed probability of trading against the log distance from mid, log(level/mid),
+    for fixed (mu, sigma, tau). The grid step is chosen so that linear interpolation stays within
+    the tolerance (|f''| <= phi(1) / sd^2 for the normal cdf) and the grid spans 9 standard
+    deviations either side of the drift, beyond which the end values are used.
+    '''
+
+    def __init__(self, mu:float, sigma:float, tau:float, tolerance:float=1e-6):
+        if (tau <= 0 or sigma <= 0 or tolerance <= 0):
+            raise ValueError("Time, volatility and tolerance should be strictly +ve. ")
+        self.muBar = (mu - 0.5*sigma*sigma)*tau
+        self.sd = sigma*np.sqrt(tau)
+        self.step = np.sqrt(8*tolerance/norm.pdf(1.0))*self.sd
+        n = int(np.ceil(18*self.sd/self.step))
+        self.start = self.muBar - 9*self.sd
+        cdf = norm.cdf((self.start + np.arange(n + 1)*self.step - self.muBar)/self.sd)
+        # probability for levels below (cdf) and above (1 - cdf) mid
+        self.below = cdf
+        self.above = 1.0 - cdf
+
+    def ProbOfTradingAtDistance(self, logDistance):
+        pos = np.clip((np.asarray(logDistance) - self.start)/self.step, 0, len(self.below) - 1)
+        i = np.minimum(pos.astype(np.int64), len(self.below) - 2)
+        w = pos - i
+        below = self.below[i] + w*(self.below[i + 1] - self.below[i])
+        above = self.above[i] + w*(self.above[i + 1] - self.above[i])
+        return np.where(np.greater(logDistance, 0), above, below)[()]
+
+    def __call__(self, mid, level):
+        return self.ProbOfTradingAtDistance(np.log(np.divide(level, mid)))
+
+
 class LogNormal:
     '''
     Log-normal risk model
     '''
 
     def __init__(self, mu:float, sigma:float, lambd:float, tau:float) -> Any:
-        if (tau < 0 or sigma <= 0 or lambd < 0.0 or lambd > 1.0):
-            raise ValueError(
-                "Time and volatility parameter should be strictly +ve and lambd must be between 0 and 1. ")
+        validate_parameters(sigma, lambd, tau)
         self.mu = mu
         self.sigma = sigma
         self.lambd = lambd
         self.tau = tau
+        self.tableKey = None
+
+    def constants(self):
+        # looked up in the shared cache so the parameters can still be changed after construction
+        return parameter_cache.constants(self.mu, self.sigma, self.lambd, self.tau)
 
     def RiskFactorLong(self) -> float:
-        sigmaBar = np.sqrt(self.tau) * self.sigma 
-        muBar=(self.mu - 0.5*self.sigma*self.sigma) * self.tau
-        quantileForLambda = norm.ppf(self.lambd)
-        logNormalEs = -(1/self.lambd)*np.exp(muBar*sigmaBar*sigmaBar*0.5) * norm.cdf(quantileForLambda-sigmaBar)
-        return logNormalEs + 1.0
+        return parameter_cache.risk_factors(self.mu, self.sigma, self.lambd, self.tau)[0]
 
     def RiskFactorShort(self) -> float:
-        sigmaBar = np.sqrt(self.tau) * self.sigma 
-        muBar=(self.mu - 0.5*self.sigma*self.sigma) * self.tau
-        quantileForOneMinusLambda = norm.ppf(1.0 - self.lambd)
-        negativeLogNormalEs = (1/self.lambd)*np.exp(muBar*sigmaBar*sigmaBar*0.5) * (1.0 - norm.cdf(quantileForOneMinusLambda-sigmaBar))
-        return negativeLogNormalEs - 1.0
-
-    def ProbOfTrading(self, mid: float, level: float) -> float:
-        transLevel = (np.log(level/mid) - (self.mu - 0.5*self.sigma*self.sigma)*self.tau) / (self.sigma*np.sqrt(self.tau))
-        if (mid < level):
-            return 1.0 - norm.cdf(transLevel)
-        else:
-            return norm.cdf(transLevel)
\ No newline at end of file
+        return parameter_cache.risk_factors(self.mu, self.sigma, self.lambd, self.tau)[1]
+
+    def ProbOfTrading(self, mid, level):
+        '''
+        Probability of trading at level(s) given mid price(s), accepting NumPy arrays (e.g. a whole book side)
+        '''
+        _, muBar, _, _, _ = self.constants()
+        transLevel = (np.log(np.divide(level, mid)) - muBar) / (self.sigma*np.sqrt(self.tau))
+        return np.where(np.less(mid, level), 1.0 - norm.cdf(transLevel), norm.cdf(transLevel))[()]
+
+    def ApproxProbOfTrading(self, mid, level, tolerance:float=1e-6):
+        '''
+        ProbOfTrading from a lookup table built once per (mu, sigma, tau) and tolerance
+        '''
+        key = (self.mu, self.sigma, self.tau, tolerance)
+        if self.tableKey != key:
+            self.tableKey = key
+            self.table = ProbOfTradingTable(*key)
+        return self.table(mid, level)
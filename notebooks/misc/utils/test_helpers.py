@@ -0,0 +1,139 @@
+import utils.helpers as helpers
+import numpy as np
+from types import SimpleNamespace
+
+
+def create_order_book(rng, n_buy, n_sell, market_dp):
+    def levels(n, start, direction):
+        prices = start + direction * np.cumsum(rng.integers(1, 50, n))
+        return [
+            SimpleNamespace(price=str(p * 10**market_dp), volume=float(v))
+            for p, v in zip(prices, rng.uniform(0.1, 5, n))
+        ]
+
+    return SimpleNamespace(buy=levels(n_buy, 1000, -1), sell=levels(n_sell, 1001, 1))
+
+
+def reference_exit_price(order_book, position, market_dp):
+    # level by level fill of the unsigned position, the whole side beyond the available depth
+    levels = order_book.buy if position > 0 else order_book.sell
+    p = abs(position)
+    v = 0
+    exit_price = 0
+    for lvl in levels:
+        x = min(lvl.volume, p)
+        exit_price += x * float(lvl.price) * 10 ** (-market_dp)
+        v += x
+        p -= x
+        if p <= 0:
+            break
+    return exit_price / v if v > 0 else np.nan
+
+
+def test_exit_prices_match_reference():
+    rng = np.random.default_rng(11)
+    market_dp = 2
+    for n_buy, n_sell in [(1, 1), (7, 12), (30, 3)]:
+        order_book = create_order_book(rng, n_buy, n_sell, market_dp)
+        positions = np.concatenate(
+            (rng.uniform(-60, 60, 200), [0, 1e-3, -1e-3, 1e6, -1e6])
+        )
+
+        exit_prices = helpers.calculate_exit_prices(order_book, positions, market_dp)
+        expected = [
+            reference_exit_price(order_book, p, market_dp) if p != 0 else np.nan
+            for p in positions
+        ]
+        assert np.allclose(exit_prices, expected, rtol=1e-12, equal_nan=True)
+        for p, e in zip(positions[-5:], exit_prices[-5:]):
+            assert np.array_equal(
+                helpers.calculate_exit_price(order_book, p, market_dp),
+                e,
+                equal_nan=True,
+            )
+
+        mark_price = 1000.5
+        slippages = helpers.calculate_slippages_per_unit(
+            mark_price, order_book, positions, market_dp
+        )
+        for p, s in zip(positions, slippages):
+            assert np.isclose(
+                helpers.calculate_slippage_per_unit(
+                    mark_price, order_book, p, market_dp
+                ),
+                s,
+                rtol=1e-12,
+            )
+
+
+def test_exit_prices_for_empty_and_one_sided_books():
+    rng = np.random.default_rng(12)
+    positions = np.array([-3.0, 0, 2.0, 500.0])
+
+    empty = SimpleNamespace(buy=[], sell=[])
+    assert np.all(np.isnan(helpers.calculate_exit_prices(empty, positions, 0)))
+    assert helpers.calculate_exit_prices(empty, [], 0).shape == (0,)
+
+    bids_only = create_order_book(rng, 5, 0, 0)
+    exit_prices = helpers.calculate_exit_prices(bids_only, positions, 0)
+    assert np.isnan(exit_prices[0]) and np.isnan(exit_prices[1])
+    assert exit_prices[2] == reference_exit_price(bids_only, 2.0, 0)
+    assert exit_prices[3] == reference_exit_price(bids_only, 500.0, 0)
+
+    asks_only = create_order_book(rng, 0, 5, 0)
+    exit_prices = helpers.calculate_exit_prices(asks_only, positions, 0)
+    assert exit_prices[0] == reference_exit_price(asks_only, -3.0, 0)
+    assert np.all(np.isnan(exit_prices[1:]))
+
+    slippages = helpers.calculate_slippages_per_unit(1000, asks_only, positions, 0)
+    assert slippages[1] == 0
+    assert np.all(np.isnan(slippages[2:]))
+
+
+def test_exit_prices_across_snapshots():
+    rng = np.random.default_rng(13)
+    market_dp = 3
+    books = [
+        create_order_book(rng, n_buy, n_sell, market_dp)
+        for n_buy, n_sell in [(5, 8), (0, 3), (12, 0), (0, 0), (1, 20)]
+    ]
+    books = [
+        create_order_book(rng, rng.integers(0, 15), rng.integers(0, 15), market_dp)
+        for _ in range(40)
+    ] + books
+
+    # the same positions against every snapshot
+    positions = np.concatenate((rng.uniform(-40, 40, 30), [0, 1e5, -1e5]))
+    exit_prices = helpers.calculate_exit_prices_for_books(books, positions, market_dp)
+    assert exit_prices.shape == (len(books), len(positions))
+    for book, row in zip(books, exit_prices):
+        expected = [
+            reference_exit_price(book, p, market_dp) if p != 0 else np.nan
+            for p in positions
+        ]
+        assert np.allclose(row, expected, rtol=1e-9, equal_nan=True)
+
+    # one row of positions per snapshot, with a mark price per snapshot
+    positions = rng.uniform(-40, 40, (len(books), 3))
+    mark_prices = rng.uniform(990, 1010, len(books))
+    exit_prices = helpers.calculate_exit_prices_for_books(books, positions, market_dp)
+    slippages = helpers.calculate_slippages_per_unit_for_books(
+        mark_prices, books, positions, market_dp
+    )
+    for i, book in enumerate(books):
+        assert np.allclose(
+            exit_prices[i],
+            helpers.calculate_exit_prices(book, positions[i], market_dp),
+            rtol=1e-9,
+            equal_nan=True,
+        )
+        assert np.allclose(
+            slippages[i],
+            helpers.calculate_slippages_per_unit(
+                mark_prices[i], book, positions[i], market_dp
+            ),
+            rtol=1e-9,
+            equal_nan=True,
+        )
+
+    assert helpers.calculate_exit_prices_for_books([], positions[0], 0).shape == (0, 3)
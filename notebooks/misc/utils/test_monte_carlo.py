@@ -0,0 +1,47 @@
+import utils.monte_carlo as mc
+import utils.risk_models as rm
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize(
+    "mu, sigma, lambd, tau",
+    [(0, 1.2, 0.01, 1 / 365.25), (0, 2, 0.01, 1 / 12), (0.1, 1.5, 0.05, 0.5)],
+)
+def test_simulated_risk_factors_match_closed_form(mu, sigma, lambd, tau):
+    # the long horizons are where a wrong expected shortfall scaling shows, e.g.
+    # exp(muBar * sigmaBar^2 / 2) instead of exp(muBar + sigmaBar^2 / 2) is ~0.1 off
+    # on the short side at sigma = 2, tau = 1/12
+    long, short = rm.risk_factors(mu, sigma, lambd, tau)
+
+    mcLong, mcShort, longStderr, shortStderr = mc.simulate_risk_factors(
+        mu, sigma, lambd, tau, draws=2 * 10**6, chunk_size=300_000, seed=3
+    )
+    assert 0 < longStderr < 0.05 and 0 < shortStderr < 0.05
+    assert abs(mcLong - long) < 4 * longStderr
+    assert abs(mcShort - short) < 4 * shortStderr
+
+    # the chunking only changes the summation order
+    rechunked = mc.simulate_risk_factors(
+        mu, sigma, lambd, tau, draws=2 * 10**6, chunk_size=10**6, seed=3
+    )
+    assert np.allclose(rechunked, (mcLong, mcShort, longStderr, shortStderr), rtol=1e-9)
+
+
+def test_validate_risk_factors():
+    kwargs = dict(draws=10**6, chunk_size=250_000, seed=7, max_workers=1)
+    results = mc.validate_risk_factors(
+        0, [0.5, 2], [1 / 365.25], [0.01, 0.05], **kwargs
+    )
+    assert len(results["sigma"]) == 4
+    long, short = rm.risk_factors(0, results["sigma"], results["lambd"], results["tau"])
+    assert np.array_equal(results["long"], long)
+    assert np.array_equal(results["short"], short)
+    assert np.all(np.abs(results["long_deviation"]) < 4 * results["long_stderr"] + 1e-6)
+    assert np.all(
+        np.abs(results["short_deviation"]) < 4 * results["short_stderr"] + 1e-6
+    )
+
+    again = mc.validate_risk_factors(0, [0.5, 2], [1 / 365.25], [0.01, 0.05], **kwargs)
+    assert np.array_equal(again["mc_long"], results["mc_long"])
+    assert np.array_equal(again["mc_short"], results["mc_short"])
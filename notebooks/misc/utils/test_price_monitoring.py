@@ -0,0 +1,59 @@
+import utils.price_monitoring as pm
+import numpy as np
+import pytest
+from scipy.stats import lognorm
+from scipy.integrate import trapezoid
+
+
+@pytest.mark.parametrize(
+    "year_fraction, probability_level",
+    [(1 / 365.25 / 24, 0.99), (1 / 365.25, 0.9999), (0.25, 0.95)],
+)
+def test_bounds_match_log_normal_quantiles(year_fraction, probability_level):
+    mu, sigma, reference_price = 0.05, 1.5, 1234.5
+    price = lognorm(
+        s=sigma * np.sqrt(year_fraction),
+        scale=reference_price * np.exp((mu - 0.5 * sigma**2) * year_fraction),
+    )
+    expected = price.ppf([(1 - probability_level) / 2, (1 + probability_level) / 2])
+
+    bounds = pm.price_monitoring_bounds(
+        reference_price, year_fraction, probability_level, mu, sigma
+    )
+    assert bounds == pytest.approx(expected, rel=1e-12)
+    assert pm.market_bounds(
+        reference_price, year_fraction, probability_level, mu, sigma
+    ) == pytest.approx(expected, rel=1e-12)
+
+    # a vector of reference prices scales the bounds
+    reference_prices = np.array([1, 10, reference_price])
+    down, up = pm.market_bounds(
+        reference_prices, year_fraction, probability_level, mu, sigma
+    )
+    assert down == pytest.approx(reference_prices / reference_price * expected[0])
+    assert up == pytest.approx(reference_prices / reference_price * expected[1])
+
+    # the density integrates to the probability level between the bounds
+    prices = np.linspace(*expected, 20001)
+    density = pm.price_density(prices, reference_price, year_fraction, mu, sigma)
+    assert density == pytest.approx(price.pdf(prices), rel=1e-9)
+    assert trapezoid(density, prices) == pytest.approx(probability_level, rel=1e-6)
+
+
+def test_bounds_broadcast_over_parameters():
+    year_fractions = np.array([[1 / 365.25], [1 / 12]])
+    probability_levels = np.array([0.9, 0.99, 0.999])
+    down, up = pm.price_monitoring_bounds(
+        100, year_fractions, probability_levels, 0, 0.8
+    )
+    assert down.shape == up.shape == (2, 3)
+    for i in range(2):
+        for j in range(3):
+            assert (down[i, j], up[i, j]) == pytest.approx(
+                pm.price_monitoring_bounds(
+                    100, year_fractions[i, 0], probability_levels[j], 0, 0.8
+                ),
+                rel=1e-12,
+            )
+    assert np.all(np.diff(down, axis=1) < 0) and np.all(np.diff(up, axis=1) > 0)
+    assert pm.price_density([0, -1], 100, 0.1, 0, 0.8) == pytest.approx([0, 0])
@@ -0,0 +1,137 @@
+import utils.risk_models as rm
+import math
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+
+def scalar_risk_factors(mu, sigma, lambd, tau):
+    # the scalar log-normal expected shortfall formulas, one parameter tuple at a time
+    sigmaBar = math.sqrt(tau) * sigma
+    muBar = (mu - 0.5 * sigma * sigma) * tau
+    scaling = (1 / lambd) * math.exp(muBar + sigmaBar * sigmaBar * 0.5)
+    long = -scaling * norm.cdf(norm.ppf(lambd) - sigmaBar) + 1.0
+    short = scaling * (1.0 - norm.cdf(norm.ppf(1.0 - lambd) - sigmaBar)) - 1.0
+    return long, short
+
+
+def scalar_prob_of_trading(mu, sigma, tau, mid, level):
+    transLevel = (math.log(level / mid) - (mu - 0.5 * sigma * sigma) * tau) / (
+        sigma * math.sqrt(tau)
+    )
+    if mid < level:
+        return 1.0 - norm.cdf(transLevel)
+    return norm.cdf(transLevel)
+
+
+def test_risk_factors_match_scalar_formulas():
+    rng = np.random.default_rng(1)
+    mu = rng.uniform(-0.1, 0.1, 50)
+    sigma = rng.uniform(0.05, 3, 50)
+    lambd = rng.uniform(1e-4, 0.1, 50)
+    tau = rng.uniform(1e-5, 1, 50)
+
+    longs, shorts = rm.risk_factors(mu, sigma, lambd, tau)
+    assert longs.shape == shorts.shape == (50,)
+    for i in range(50):
+        long, short = scalar_risk_factors(mu[i], sigma[i], lambd[i], tau[i])
+        assert longs[i] == pytest.approx(long, rel=1e-12)
+        assert shorts[i] == pytest.approx(short, rel=1e-12)
+
+        model = rm.LogNormal(mu[i], sigma[i], lambd[i], tau[i])
+        assert model.RiskFactorLong() == pytest.approx(long, rel=1e-12)
+        assert model.RiskFactorShort() == pytest.approx(short, rel=1e-12)
+
+    # a single market against a range of horizons
+    longs, shorts = rm.risk_factors(0, 1.2, 0.01, tau)
+    for i in range(50):
+        assert (longs[i], shorts[i]) == pytest.approx(
+            scalar_risk_factors(0, 1.2, 0.01, tau[i]), rel=1e-12
+        )
+
+    with pytest.raises(ValueError):
+        rm.risk_factors(mu, -sigma, lambd, tau)
+    with pytest.raises(ValueError):
+        rm.risk_factors(mu, sigma, lambd + 1, tau)
+
+
+def test_prob_of_trading_matches_scalar_formula():
+    rng = np.random.default_rng(2)
+    mu, sigma, tau = 0.01, 0.8, 1 / 365.25
+    model = rm.LogNormal(mu, sigma, 0.01, tau)
+    mids = rng.uniform(90, 110, 200)
+    levels = mids * np.exp(rng.normal(0, 0.05, 200))
+
+    probabilities = rm.prob_of_trading(mu, sigma, tau, mids, levels)
+    book = model.ProbOfTrading(100, levels)
+    for i in range(200):
+        expected = scalar_prob_of_trading(mu, sigma, tau, mids[i], levels[i])
+        assert probabilities[i] == pytest.approx(expected, rel=1e-12, abs=1e-15)
+        assert model.ProbOfTrading(mids[i], levels[i]) == pytest.approx(
+            expected, rel=1e-12, abs=1e-15
+        )
+        assert book[i] == pytest.approx(
+            scalar_prob_of_trading(mu, sigma, tau, 100, levels[i]),
+            rel=1e-12,
+            abs=1e-15,
+        )
+
+
+@pytest.mark.parametrize("tolerance", [1e-4, 1e-6])
+def test_prob_of_trading_table_matches_direct_computation(tolerance):
+    mu, sigma, tau = 0.02, 1.5, 1 / 24
+    table = rm.ProbOfTradingTable(mu, sigma, tau, tolerance)
+    sd = sigma * np.sqrt(tau)
+
+    # dense enough to land between the grid points, wide enough to cover the flat ends
+    mids = np.full(100001, 1000.0)
+    levels = mids * np.exp(np.linspace(-12 * sd, 12 * sd, len(mids)))
+    expected = rm.prob_of_trading(mu, sigma, tau, mids, levels)
+    assert np.max(np.abs(table(mids, levels) - expected)) <= tolerance
+
+    model = rm.LogNormal(mu, sigma, 0.01, tau)
+    assert (
+        np.max(np.abs(model.ApproxProbOfTrading(mids, levels, tolerance) - expected))
+        <= tolerance
+    )
+    assert model.ApproxProbOfTrading(1000, 1010, tolerance) == pytest.approx(
+        model.ProbOfTrading(1000, 1010), abs=tolerance
+    )
+
+    with pytest.raises(ValueError):
+        rm.ProbOfTradingTable(mu, sigma, tau, 0)
+
+
+def test_parameter_cache(monkeypatch):
+    cache = rm.ParameterCache(maxsize=3)
+    constants = cache.constants(0, 0.8, 0.005, 1 / 365.25)
+    assert cache.stats() == {"hits": 0, "misses": 1, "size": 1, "maxsize": 3}
+
+    # repeat lookups are served from the cache
+    assert cache.constants(0, 0.8, 0.005, 1 / 365.25) is constants
+    assert cache.constants(0.0, 0.8, 0.005, 1 / 365.25) is constants
+    assert cache.stats()["hits"] == 2
+
+    def fail(*args):
+        raise AssertionError("only the constants were asked for")
+
+    # the price monitoring bounds only need the constants
+    with monkeypatch.context() as m:
+        m.setattr(rm, "risk_factors", fail)
+        cache.constants(0, 0.8, 0.1, 1 / 365.25)
+    assert cache.stats()["misses"] == 2
+
+    factors = cache.risk_factors(0, 0.8, 0.005, 1 / 365.25)
+    assert factors == rm.risk_factors(0, 0.8, 0.005, 1 / 365.25)
+    assert cache.risk_factors(0, 0.8, 0.005, 1 / 365.25) is factors
+    assert cache.stats() == {"hits": 3, "misses": 3, "size": 3, "maxsize": 3}
+
+    # least recently used entries are evicted first
+    cache.constants(0, 0.8, 0.005, 1 / 365.25)
+    cache.constants(0, 0.9, 0.005, 1 / 365.25)
+    assert cache.constants(0, 0.8, 0.005, 1 / 365.25) is constants
+    cache.constants(0, 0.8, 0.1, 1 / 365.25)
+    assert cache.stats()["misses"] == 5
+
+    cache.clear()
+    assert cache.stats() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 3}
@@ -0,0 +1,141 @@
+import os
+import functools
+import datetime as dt
+import pandas as pd
+import modules.curves as curves
+import modules.perps as perps
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+
+COLUMNS = [
+    "market",
+    "data_set",
+    "funding_payment_frequency",
+    "spot_sampling_frequency",
+    "perp_sampling_frequency",
+    "interest_rate",
+    "clamp_lower_bound",
+    "clamp_upper_bound",
+    "start",
+    "end",
+    "spot_twap",
+    "perp_twap",
+    "payment",
+    "rate",
+]
+
+
+class Scenario:
+    def __init__(
+        self,
+        market: str,
+        spot_path: str,
+        perp_path: str,
+        start_date: dt.datetime,
+        end_date: dt.datetime,
+        funding_payment_frequency: dt.timedelta,
+        spot_sampling_frequency: dt.timedelta,
+        perp_sampling_frequency: dt.timedelta,
+        interest_rate: float = 0,
+        clamp_lower_bound: float = 0,
+        clamp_upper_bound: float = 0,
+        data_set: str = "",
+    ):
+        self.market = market
+        self.spot_path = spot_path
+        self.perp_path = perp_path
+        self.start_date = start_date
+        self.end_date = end_date
+        self.funding_payment_frequency = funding_payment_frequency
+        self.spot_sampling_frequency = spot_sampling_frequency
+        self.perp_sampling_frequency = perp_sampling_frequency
+        self.interest_rate = interest_rate
+        self.clamp_lower_bound = clamp_lower_bound
+        self.clamp_upper_bound = clamp_upper_bound
+        self.data_set = data_set
+
+    def labels(self) -> dict:
+        return {
+            "market": self.market,
+            "data_set": self.data_set,
+            "funding_payment_frequency": self.funding_payment_frequency,
+            "spot_sampling_frequency": self.spot_sampling_frequency,
+            "perp_sampling_frequency": self.perp_sampling_frequency,
+            "interest_rate": self.interest_rate,
+            "clamp_lower_bound": self.clamp_lower_bound,
+            "clamp_upper_bound": self.clamp_upper_bound,
+        }
+
+
+@functools.lru_cache(maxsize=32)
+def load_curve(path: str, mtime: float):
+    # the price columns are read from the memory-mapped .npy cache, which saves each
+    # worker from parsing the file, but the Akima interpolator copies them and adds its
+    # coefficients, so every worker process still holds its own copy of each curve
+    return curves.FlatExtensionCurve(curves.load_interpolator(path))
+
+
+def run_scenario(scenario: Scenario) -> pd.DataFrame:
+    spot_curve = load_curve(scenario.spot_path, os.path.getmtime(scenario.spot_path))
+    perp_curve = load_curve(scenario.perp_path, os.path.getmtime(scenario.perp_path))
+
+    funding_periods = perps.compute_funding_periods(
+        perps.create_schedule(
+            scenario.start_date,
+            scenario.end_date,
+            scenario.funding_payment_frequency,
+            True,
+        ),
+        perps.create_schedule(
+            scenario.start_date, scenario.end_date, scenario.spot_sampling_frequency
+        ),
+        perps.create_schedule(
+            scenario.start_date, scenario.end_date, scenario.perp_sampling_frequency
+        ),
+        spot_curve,
+        perp_curve,
+        scenario.interest_rate,
+        scenario.clamp_lower_bound,
+        scenario.clamp_upper_bound,
+    )
+
+    frame = funding_periods.to_frame()
+    for column, value in scenario.labels().items():
+        frame[column] = value
+    return frame[COLUMNS]
+
+
+def run_backtests(
+    scenarios: List[Scenario], max_workers: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Runs the scenarios across a process pool (serially when max_workers is 1) and
+    gathers one row per funding period into a single frame. Price files are parsed
+    once up front into their .npy caches, which the workers load instead of the files;
+    each worker builds its own interpolators from them.
+    """
+    for path in {p for s in scenarios for p in (s.spot_path, s.perp_path)}:
+        curves.load_price_data(path)
+
+    if max_workers == 1:
+        results = [run_scenario(s) for s in scenarios]
+    else:
+        # scenarios sharing price files are kept together so worker curve caches are reused
+        order = sorted(
+            range(len(scenarios)),
+            key=lambda i: (scenarios[i].spot_path, scenarios[i].perp_path),
+        )
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            workers = max_workers or os.cpu_count() or 1
+            chunksize = max(1, len(scenarios) // (4 * workers))
+            ordered = executor.map(
+                run_scenario, [scenarios[i] for i in order], chunksize=chunksize
+            )
+            results = [None] * len(scenarios)
+            for i, frame in zip(order, ordered):
+                results[i] = frame
+
+    if len(results) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(results, ignore_index=True)
@@ -1,7 +1,13 @@
+import io
+import os
+import itertools
+import functools
+import collections
 import numpy as np
 import pandas as pd
 import scipy.interpolate as interp
 import datetime as dt
+import modules.perps as perps
 import modules.plots as plots
 
 
@@ -13,8 +19,8 @@ class SimpleCurveBetweenDates:
         start_value: float,
         relatove_change_over_period: float = 0,
     ):
-        self.start = start_date.timestamp()
-        self.end = end_date.timestamp()
+        self.start = perps.to_timestamps(start_date)
+        self.end = perps.to_timestamps(end_date)
         self.a = start_value * relatove_change_over_period / (self.end - self.start)
         self.b = start_value
 
@@ -25,11 +31,7 @@ class SimpleCurveBetweenDates:
         self.max = max(curve_at_start, curve_at_end)
 
     def __call__(self, xs):
-        if type(xs) is dt.datetime:
-            xs = xs.timestamp()
-        if np.isscalar(xs):
-            return self.evaluate(xs)
-        return np.array([self.evaluate(x) for x in xs])
+        return self.evaluate(perps.to_timestamps(xs))
 
     def evaluate(self, x):
         return self.a * (x - self.start) + self.b
@@ -45,18 +47,14 @@ class FlatExtensionCurve:
         self.max = max(ys)
 
     def __call__(self, xs):
-        if type(xs) is dt.datetime:
-            xs = xs.timestamp()
-        if np.isscalar(xs):
-            return self.evaluate(xs)
-        return np.array([self.evaluate(x) for x in xs])
+        return self.evaluate(perps.to_timestamps(xs))
 
     def evaluate(self, x):
-        if x < self.x_min:
-            x = self.x_min
-        if x > self.x_max:
-            x = self.x_max
-        return self.base_curve(x)
+        return self.base_curve(np.clip(x, self.x_min, self.x_max))
+
+    @property
+    def supports_arrays(self):
+        return perps.supports_arrays(self.base_curve)
 
 
 class TransformedCurve:
@@ -69,9 +67,7 @@ class TransformedCurve:
         self.horizontal_shift = horizontal_shift
 
     def __call__(self, xs):
-        if np.isscalar(xs):
-            return self.evaluate(xs)
-        return np.array([self.evaluate(x) for x in xs])
+        return self.evaluate(perps.to_timestamps(xs))
 
     def evaluate(self, x):
         return (
@@ -79,6 +75,10 @@ class TransformedCurve:
             + self.vertical_shift
         )
 
+    @property
+    def supports_arrays(self):
+        return perps.supports_arrays(self.curve)
+
 
 class SuperimposedCurve:
     def __init__(self, curve_1, curve_2):
@@ -88,11 +88,7 @@ class SuperimposedCurve:
         self.curve_2 = curve_2
 
     def __call__(self, xs):
-        if type(xs) is dt.datetime:
-            xs = xs.timestamp()
-        if np.isscalar(xs):
-            return self.evaluate(xs)
-        return np.array([self.evaluate(x) for x in xs])
+        return self.evaluate(perps.to_timestamps(xs))
 
     def evaluate(self, x):
         ret = 0
@@ -102,38 +98,399 @@ class SuperimposedCurve:
             ret += self.curve_2(x)
         return ret
 
+    @property
+    def supports_arrays(self):
+        return all(
+            perps.supports_arrays(c)
+            for c in [self.curve_1, self.curve_2]
+            if c is not None
+        )
+
+
 class DiscreteCurve:
-    def __init__(self, map: dict[dt.datetime,float]):
+    supports_arrays = False
+
+    def __init__(self, map: dict[dt.datetime, float]):
         self.map = map
-    
+
     def __call__(self, x):
         return self.map[x]
 
-def create_curve_from_file(
-    dir, scaling=1, horizontal_shift=0, vertical_shift=0, ax=None
-):
+
+class StepCurve:
+    """Value of the last observation at or before x (NaN before the first one)."""
+
+    def __init__(self, times, values):
+        self.times = perps.to_timestamps(times)
+        self.values = np.asarray(values, dtype=float)
+        if len(self.times) != len(self.values):
+            raise ValueError("times and values must have the same length")
+
+    def __call__(self, xs):
+        return self.evaluate(perps.to_timestamps(xs))
+
+    def evaluate(self, x):
+        i = np.searchsorted(self.times, x, "right") - 1
+        return np.where(i >= 0, self.values[np.maximum(i, 0)], np.nan)[()]
+
+
+class CompiledCurve:
+    """
+    Flattened form of a tree of curves: slope * x + intercept plus a sum of
+    scale * leaf(x - horizontal_shift) terms, evaluated in a single NumPy expression.
+    """
+
+    def __init__(self, slope=0, intercept=0, terms=None):
+        self.slope = slope
+        self.intercept = intercept
+        self.terms = [] if terms is None else terms
+
+    def __call__(self, xs):
+        return self.evaluate(perps.to_timestamps(xs))
+
+    def evaluate(self, x):
+        ret = self.intercept
+        if self.slope != 0:
+            ret = ret + self.slope * x
+        for scale, horizontal_shift, leaf in self.terms:
+            ret = ret + scale * leaf(x - horizontal_shift)
+        return ret
+
+    def transform(self, scaling_factor=1, horizontal_shift=0, vertical_shift=0):
+        return CompiledCurve(
+            scaling_factor * self.slope,
+            scaling_factor * (self.intercept - self.slope * horizontal_shift)
+            + vertical_shift,
+            [(scaling_factor * s, h + horizontal_shift, c) for s, h, c in self.terms],
+        )
+
+    @property
+    def supports_arrays(self):
+        return all(perps.supports_arrays(leaf) for _, _, leaf in self.terms)
+
+    def add(self, other):
+        terms = list(self.terms)
+        for scale, horizontal_shift, leaf in other.terms:
+            for i, (s, h, c) in enumerate(terms):
+                if c is leaf and h == horizontal_shift:
+                    terms[i] = (s + scale, h, c)
+                    break
+            else:
+                terms.append((scale, horizontal_shift, leaf))
+        return CompiledCurve(
+            self.slope + other.slope, self.intercept + other.intercept, terms
+        )
+
+
+def compile_curve(curve) -> CompiledCurve:
+    """
+    Collapses nested TransformedCurve/SuperimposedCurve trees into a CompiledCurve:
+    chains of affine transforms become a single scale and shift per leaf and linear curves
+    are folded into the slope and intercept. Any other callable is kept as a leaf.
+    """
+    if isinstance(curve, CompiledCurve):
+        return curve
+    if isinstance(curve, SimpleCurveBetweenDates):
+        return CompiledCurve(curve.a, curve.b - curve.a * curve.start)
+    if isinstance(curve, TransformedCurve):
+        return compile_curve(curve.curve).transform(
+            curve.scaling_factor, curve.horizontal_shift, curve.vertical_shift
+        )
+    if isinstance(curve, SuperimposedCurve):
+        ret = CompiledCurve()
+        for c in [curve.curve_1, curve.curve_2]:
+            if c is not None:
+                ret = ret.add(compile_curve(c))
+        return ret
+    return CompiledCurve(terms=[(1, 0, curve)])
+
+
+class GridCurve:
+    """
+    Curve pre-sampled on a fixed-step grid between x_min and x_max and evaluated with index
+    arithmetic and linear interpolation (flat extension outside the grid). When a tolerance
+    is given the step is halved (down to min_step) until the error at the grid midpoints is
+    within it. That error is an estimate, not a bound: features narrower than the step can
+    fall between the sampled points. Grids of more than max_points points raise a ValueError.
+    """
+
+    def __init__(
+        self,
+        base_curve,
+        x_min,
+        x_max,
+        step=120,
+        tolerance=None,
+        min_step=1,
+        max_points=5_000_000,
+    ):
+        if step <= 0:
+            raise ValueError("grid step must be positive")
+        self.x_min = x_min
+        while True:
+            n = max(1, int(np.ceil((x_max - x_min) / step)))
+            if n + 1 > max_points:
+                raise ValueError(
+                    f"a grid step of {step:g}s needs {n + 1:,} points, more than "
+                    f"max_points={max_points:,}; increase the step or the tolerance"
+                )
+            xs = x_min + np.arange(n + 1) * step
+            ys = np.asarray(base_curve(xs), dtype=float)
+            mids = np.asarray(base_curve(xs[:-1] + step / 2), dtype=float)
+            self.error = np.max(np.abs(mids - (ys[:-1] + ys[1:]) / 2))
+            if tolerance is None or self.error <= tolerance or step / 2 < min_step:
+                break
+            step = step / 2
+        self.step = step
+        self.x_max = xs[-1]
+        self.ys = ys
+        self.min = min(ys)
+        self.max = max(ys)
+
+    def __call__(self, xs):
+        return self.evaluate(perps.to_timestamps(xs))
+
+    def evaluate(self, x):
+        pos = (np.clip(x, self.x_min, self.x_max) - self.x_min) / self.step
+        i = np.minimum(np.floor(pos).astype(np.int64), len(self.ys) - 2)
+        return self.ys[i] + (pos - i) * (self.ys[i + 1] - self.ys[i])
+
+
+def price_data_cache_path(dir):
+    return f"{dir}.cache.npy"
+
+
+def read_price_data_cache(cache_path, stamp):
+    """Memory-maps the cached columns when the cache was written for the given source stamp."""
+    with open(cache_path, "rb") as f:
+        if not np.array_equal(np.load(f), stamp):
+            return None
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(cache_path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def load_price_data(dir, use_cache=True):
+    """
+    Returns (timestamps, prices) from a price file, dropping the 5% lowest volume rows when
+    a volume column is present. The filtered columns are cached next to the file as a
+    memory-mappable structured .npy preceded by the source modification time and size, so
+    later loads map it instead of re-parsing the file until the source changes.
+    """
     col_vol = "volume"
     col_date = "date"
     col_price = "price"
 
+    cache_path = price_data_cache_path(dir)
+    source = os.stat(dir)
+    stamp = np.array([source.st_mtime_ns, source.st_size], dtype=np.int64)
+    if use_cache:
+        try:
+            data = read_price_data_cache(cache_path, stamp)
+            if data is not None:
+                return data[col_date], data[col_price]
+        except (OSError, ValueError):
+            pass
+
     df = pd.read_csv(dir)
 
     if col_vol in df:
         df = df[df[col_vol] > df[col_vol].quantile(0.05)]
 
-    timestamps = df[col_date]
-    prices = df[col_price]
-    cs = interp.Akima1DInterpolator(timestamps, prices)
-    xs = np.arange(timestamps.min(), timestamps.max(), 120)
+    data = np.empty(len(df), dtype=[(col_date, float), (col_price, float)])
+    data[col_date] = df[col_date]
+    data[col_price] = df[col_price]
+
+    if use_cache:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, stamp)
+                np.save(f, data)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return data[col_date], data[col_price]
+
+
+def load_interpolator(dir, use_cache=True):
+    timestamps, prices = load_price_data(dir, use_cache)
+    return interp.Akima1DInterpolator(timestamps, prices)
+
+
+@functools.lru_cache(maxsize=16)
+def load_grid_curve(dir, mtime, grid_step, tolerance):
+    """Grid sampled file-backed curve, cached by path, modification time, step and tolerance."""
+    cs = load_interpolator(dir)
+    return GridCurve(FlatExtensionCurve(cs), cs.x[0], cs.x[-1], grid_step, tolerance)
+
+
+class StreamingFileCurve:
+    """
+    Flat-extended Akima curve over a price file too large to load at once.
+    A single pass indexes the file in chunks of rows (byte offset, first timestamp
+    and volume threshold per chunk). Segments are then fitted lazily per chunk,
+    including `overlap` rows of the neighbouring chunks so that the local Akima
+    interpolant matches across the seams. At most `max_segments` fitted segments
+    are kept in memory. Low volume rows are dropped per chunk (5% quantile of the chunk).
+    """
+
+    col_vol = "volume"
+    col_date = "date"
+    col_price = "price"
+
+    def __init__(self, dir, chunk_size=1_000_000, overlap=16, max_segments=4):
+        if chunk_size <= 2 * overlap:
+            raise ValueError("chunk size must be larger than twice the overlap")
+        self.dir = dir
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.max_segments = max_segments
+        self.segments = collections.OrderedDict()
+
+        offsets = []
+        tail_offsets = []
+        lengths = []
+        thresholds = []
+        firsts = []
+        self.x_max = None
+        self.min = np.inf
+        self.max = -np.inf
+        with open(dir, "rb") as f:
+            self.columns = f.readline().decode("utf-8-sig").strip().split(",")
+            while True:
+                offset = f.tell()
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    break
+                df = self.parse(b"".join(lines))
+                threshold = None
+                if self.col_vol in df:
+                    threshold = df[self.col_vol].quantile(0.05)
+                    df = df[df[self.col_vol] > threshold]
+                offsets.append(offset)
+                tail_offsets.append(
+                    offset + sum(len(x) for x in lines[: max(0, len(lines) - overlap)])
+                )
+                lengths.append(len(lines))
+                thresholds.append(threshold)
+                firsts.append(df[self.col_date].iloc[0] if len(df) > 0 else np.nan)
+                if len(df) > 0:
+                    self.x_max = df[self.col_date].iloc[-1]
+                    self.min = min(self.min, df[self.col_price].min())
+                    self.max = max(self.max, df[self.col_price].max())
+
+        # chunks left empty by the volume filter are merged into their predecessors
+        keep = ~np.isnan(firsts)
+        if not np.any(keep):
+            raise ValueError(f"no price data in {dir}")
+        self.offsets = np.array(offsets)
+        self.tail_offsets = np.array(tail_offsets)
+        self.lengths = np.array(lengths)
+        self.thresholds = thresholds
+        self.firsts = np.array(firsts)[keep]
+        self.chunks = np.flatnonzero(keep)
+        self.x_min = self.firsts[0]
+
+    def parse(self, data):
+        return pd.read_csv(io.BytesIO(data), header=None, names=self.columns)
+
+    def load_chunk_rows(self, f, offset, nrows, chunk):
+        f.seek(offset)
+        df = self.parse(b"".join(itertools.islice(f, nrows)))
+        if self.thresholds[chunk] is not None:
+            df = df[df[self.col_vol] > self.thresholds[chunk]]
+        return df
+
+    def segment(self, i):
+        if i in self.segments:
+            self.segments.move_to_end(i)
+            return self.segments[i]
+
+        first = self.chunks[i]
+        last = (
+            self.chunks[i + 1] - 1
+            if i + 1 < len(self.chunks)
+            else len(self.offsets) - 1
+        )
+        frames = []
+        with open(self.dir, "rb") as f:
+            if first > 0:
+                frames.append(
+                    self.load_chunk_rows(
+                        f, self.tail_offsets[first - 1], self.overlap, first - 1
+                    )
+                )
+            for c in range(first, last + 1):
+                frames.append(
+                    self.load_chunk_rows(f, self.offsets[c], self.lengths[c], c)
+                )
+            if last + 1 < len(self.offsets):
+                frames.append(
+                    self.load_chunk_rows(
+                        f, self.offsets[last + 1], self.overlap, last + 1
+                    )
+                )
+        df = pd.concat(frames)
+        segment = interp.Akima1DInterpolator(df[self.col_date], df[self.col_price])
+
+        self.segments[i] = segment
+        if len(self.segments) > self.max_segments:
+            self.segments.popitem(last=False)
+        return segment
+
+    def __call__(self, xs):
+        return self.evaluate(perps.to_timestamps(xs))
+
+    def evaluate(self, x):
+        x = np.clip(x, self.x_min, self.x_max)
+        segments = np.searchsorted(self.firsts, x, "right") - 1
+        if np.ndim(x) == 0:
+            return self.segment(int(segments))(x)
+        ret = np.empty(np.shape(x))
+        for i in np.unique(segments):
+            mask = segments == i
+            ret[mask] = self.segment(int(i))(x[mask])
+        return ret
+
+
+def create_curve_from_file(
+    dir,
+    scaling=1,
+    horizontal_shift=0,
+    vertical_shift=0,
+    ax=None,
+    grid_step=None,
+    tolerance=None,
+    chunk_size=None,
+):
+    if chunk_size is not None:
+        base_curve = StreamingFileCurve(dir, chunk_size)
+        cs = None
+    elif grid_step is not None:
+        base_curve = load_grid_curve(dir, os.path.getmtime(dir), grid_step, tolerance)
+        cs = None
+    else:
+        cs = load_interpolator(dir)
+        base_curve = FlatExtensionCurve(cs)
+
     if ax != None:
-        ax.plot(timestamps, prices, "o", label="data point")
-        ax.plot(xs, cs(xs), label="interpolation")
+        if cs is None and chunk_size is None:
+            cs = load_interpolator(dir)
+        if cs is not None:
+            ax.plot(cs.x, cs(cs.x), "o", label="data point")
+        xs = np.arange(base_curve.x_min, base_curve.x_max, 120)
+        ax.plot(xs, base_curve(xs), label="interpolation")
         ax.legend(loc="upper center", ncol=2)
         plots.format_axis(ax)
 
-    return TransformedCurve(
-        FlatExtensionCurve(cs), scaling, horizontal_shift, vertical_shift
-    )
+    return TransformedCurve(base_curve, scaling, horizontal_shift, vertical_shift)
 
 
 def create_simple_curve(
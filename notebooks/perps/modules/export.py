@@ -0,0 +1,53 @@
+import os
+import modules.figures as figs
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+
+FIGURES = {
+    "spot_perp_difference": figs.spot_perp_difference,
+    "funding_periods": figs.funding_periods,
+}
+
+
+class FigureSpec:
+    def __init__(
+        self,
+        figure: str,
+        plot_save_path: str,
+        parameters: dict,
+        figsize: tuple = (15, 5),
+    ):
+        if figure not in FIGURES:
+            raise ValueError(f"unknown figure '{figure}'")
+        self.figure = figure
+        self.plot_save_path = plot_save_path
+        self.parameters = parameters
+        self.figsize = figsize
+
+
+def render(spec: FigureSpec) -> str:
+    # a standalone Figure is drawn by the Agg canvas when saved, pyplot is never involved
+    figure = Figure(figsize=spec.figsize)
+    FIGURES[spec.figure](
+        **spec.parameters, plot_save_path=spec.plot_save_path, figure=figure
+    )
+    return spec.plot_save_path
+
+
+def export_figures(
+    specs: List[FigureSpec], max_workers: Optional[int] = None
+) -> List[str]:
+    """
+    Renders the figures to their PNG paths across a process pool (serially when
+    max_workers is 1) and returns the paths in the order of the specs.
+    Curves passed in the parameters are pickled to the workers.
+    """
+    if max_workers == 1:
+        return [render(spec) for spec in specs]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(specs) // (4 * workers))
+        return list(executor.map(render, specs, chunksize=chunksize))
@@ -1,12 +1,14 @@
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import datetime as dt
 import modules.curves as curves
 import modules.perps as perps
 import modules.plots as plots
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Tuple
 
 
-def spot_perp_difference(
+def create_curves(
     start_date: dt.datetime,
     end_date: dt.datetime,
     use_spot_curve_1: bool = False,
@@ -25,20 +27,10 @@ def spot_perp_difference(
     perp_curve_1_vertical_shift: float = 0,
     perp_curve_2_starting_value: float = 0,
     perp_curve_2_relative_change: float = 0,
-    show: bool = False,
-    plot_save_path: Optional[str] = None,
-):
-    if not show:
-        plt.ioff()
-        plt.clf()
-    else:
-        plt.ion()
-
-    _, ax = plt.subplots(1, 3, figsize=(15, 5))
-    ax[0].set_title("spot price")
-    ax[1].set_title("perp price")
-    ax[2].set_title("price difference")
-
+    curve_grid_step: Optional[float] = None,
+    curve_grid_tolerance: Optional[float] = None,
+) -> Tuple[Any, Any]:
+    """The spot and perp curves of spot_perp_difference, without plotting them."""
     spot_curve_1 = None
     spot_curve_2 = None
     perp_curve_1 = None
@@ -56,6 +48,8 @@ def spot_perp_difference(
             scaling=spot_curve_1_scaling,
             horizontal_shift=spot_curve_1_horizontal_shift,
             vertical_shift=spot_curve_1_vertical_shift,
+            grid_step=curve_grid_step,
+            tolerance=curve_grid_tolerance,
         )
 
     if use_perp_curve_1:
@@ -68,6 +62,8 @@ def spot_perp_difference(
             scaling=perp_curve_1_scaling,
             horizontal_shift=perp_curve_1_horizontal_shift,
             vertical_shift=perp_curve_1_vertical_shift,
+            grid_step=curve_grid_step,
+            tolerance=curve_grid_tolerance,
         )
 
     if use_spot_curve_2:
@@ -90,42 +86,151 @@ def spot_perp_difference(
         spot_resulting_curve = curves.create_superimposed_curve(
             spot_curve_1,
             spot_curve_2,
-            ax=ax[0],
-            start_date=start_date,
-            end_date=end_date,
-            add_labels=False,
         )
     else:
-        spot_resulting_curve = curves.create_simple_curve(
-            start_date, end_date, 0, 0, ax=ax[0]
-        )
+        spot_resulting_curve = curves.create_simple_curve(start_date, end_date, 0, 0)
 
     if perp_curve_1 != None or perp_curve_2 != None:
         perp_resulting_curve = curves.create_superimposed_curve(
             perp_curve_1,
             perp_curve_2,
-            ax=ax[1],
-            start_date=start_date,
-            end_date=end_date,
-            add_labels=False,
         )
     else:
-        perp_resulting_curve = curves.create_simple_curve(
-            start_date, end_date, 0, 0, ax=ax[1]
-        )
+        perp_resulting_curve = curves.create_simple_curve(start_date, end_date, 0, 0)
+
+    return spot_resulting_curve, perp_resulting_curve
+
+
+def plot_curves(
+    start_date: dt.datetime,
+    end_date: dt.datetime,
+    spot_curve: Any,
+    perp_curve: Any,
+    show: bool = False,
+    plot_save_path: Optional[str] = None,
+    figure: Optional[Figure] = None,
+):
+    """
+    Plots the spot and perp curves and their difference. When a figure is given the
+    charts are drawn on it (and saved from it) without touching the pyplot state,
+    e.g. for a headless export.
+    """
+    if figure is not None:
+        ax = figure.subplots(1, 3)
+    else:
+        if not show:
+            plt.ioff()
+            plt.clf()
+        else:
+            plt.ion()
+
+        _, ax = plt.subplots(1, 3, figsize=(15, 5))
+    ax[0].set_title("spot price")
+    ax[1].set_title("perp price")
+    ax[2].set_title("price difference")
+
+    plots.plot_curve(spot_curve, ax[0], start_date, end_date, False)
+    plots.plot_curve(perp_curve, ax[1], start_date, end_date, False)
+    plots.plot_curve_difference(ax[2], perp_curve, spot_curve, start_date, end_date)
+
+    if figure is not None:
+        if not plot_save_path is None:
+            figure.savefig(plot_save_path, bbox_inches="tight")
+        return
 
-    plots.plot_curve_difference(
-        ax[2], perp_resulting_curve, spot_resulting_curve, start_date, end_date
-    )
     if not plot_save_path is None:
         plt.savefig(plot_save_path, bbox_inches="tight")
 
     if show:
         plt.show()
+
+
+def spot_perp_difference(
+    start_date: dt.datetime,
+    end_date: dt.datetime,
+    use_spot_curve_1: bool = False,
+    use_spot_curve_2: bool = False,
+    spot_curve_1_path: str = "",
+    spot_curve_1_scaling: float = 1,
+    spot_curve_1_horizontal_shift: float = 0,
+    spot_curve_1_vertical_shift: float = 0,
+    spot_curve_2_starting_value: float = 0,
+    spot_curve_2_relative_change: float = 0,
+    use_perp_curve_1: bool = False,
+    use_perp_curve_2: bool = False,
+    perp_curve_1_path: str = "",
+    perp_curve_1_scaling: float = 1,
+    perp_curve_1_horizontal_shift: float = 0,
+    perp_curve_1_vertical_shift: float = 0,
+    perp_curve_2_starting_value: float = 0,
+    perp_curve_2_relative_change: float = 0,
+    show: bool = False,
+    plot_save_path: Optional[str] = None,
+    curve_grid_step: Optional[float] = None,
+    curve_grid_tolerance: Optional[float] = None,
+    figure: Optional[Figure] = None,
+):
+    """
+    When a figure is given the charts are drawn on it (and saved from it) without
+    touching the pyplot state, e.g. for a headless export.
+    """
+    spot_resulting_curve, perp_resulting_curve = create_curves(
+        start_date=start_date,
+        end_date=end_date,
+        use_spot_curve_1=use_spot_curve_1,
+        use_spot_curve_2=use_spot_curve_2,
+        spot_curve_1_path=spot_curve_1_path,
+        spot_curve_1_scaling=spot_curve_1_scaling,
+        spot_curve_1_horizontal_shift=spot_curve_1_horizontal_shift,
+        spot_curve_1_vertical_shift=spot_curve_1_vertical_shift,
+        spot_curve_2_starting_value=spot_curve_2_starting_value,
+        spot_curve_2_relative_change=spot_curve_2_relative_change,
+        use_perp_curve_1=use_perp_curve_1,
+        use_perp_curve_2=use_perp_curve_2,
+        perp_curve_1_path=perp_curve_1_path,
+        perp_curve_1_scaling=perp_curve_1_scaling,
+        perp_curve_1_horizontal_shift=perp_curve_1_horizontal_shift,
+        perp_curve_1_vertical_shift=perp_curve_1_vertical_shift,
+        perp_curve_2_starting_value=perp_curve_2_starting_value,
+        perp_curve_2_relative_change=perp_curve_2_relative_change,
+        curve_grid_step=curve_grid_step,
+        curve_grid_tolerance=curve_grid_tolerance,
+    )
+    plot_curves(
+        start_date,
+        end_date,
+        spot_resulting_curve,
+        perp_resulting_curve,
+        show,
+        plot_save_path,
+        figure,
+    )
     return spot_resulting_curve, perp_resulting_curve
 
 
-def funding_periods(
+class FundingData:
+    """Funding periods together with the sampled curves they were computed from."""
+
+    def __init__(
+        self,
+        funding_periods: perps.FundingPeriods,
+        spot_sampling_schedule,
+        spot_points,
+        perp_sampling_schedule,
+        perp_points,
+        spot_curve: Any,
+        perp_curve: Any,
+    ):
+        self.funding_periods = funding_periods
+        self.spot_sampling_schedule = spot_sampling_schedule
+        self.spot_points = spot_points
+        self.perp_sampling_schedule = perp_sampling_schedule
+        self.perp_points = perp_points
+        self.spot_curve = spot_curve
+        self.perp_curve = perp_curve
+
+
+def compute_funding_data(
     start_date: dt.datetime,
     end_date: dt.datetime,
     spot_curve: Any,
@@ -136,36 +241,14 @@ def funding_periods(
     interest_rate: float = 0,
     clamp_lower_bound: float = 0,
     clamp_upper_bound: float = 0,
-    show_funding_payment: bool = False,
-    show_funding_rate: bool = False,
-    show_spot_twap: bool = False,
-    show_perp_twap: bool = False,
-    show_spot_step: bool = False,
-    show_perp_step: bool = False,
-    show_spot_points: bool = False,
-    show_perp_points: bool = False,
-    zoom: Optional[List] = None,
-    show: bool = False,
-    plot_save_path: Optional[str] = None,
-):
-    save = not plot_save_path is None
-    ax = None
-
-    if show:
-        plt.ion()
-    else:
-        plt.ioff()
-        plt.clf()
-
-    if save or show:
-        _, ax = plt.subplots(1, 1, figsize=(15, 5))
+) -> FundingData:
+    spot_curve = curves.compile_curve(spot_curve)
+    perp_curve = curves.compile_curve(perp_curve)
 
     funding_schedule = perps.create_schedule(
         start_date,
         end_date,
         funding_payment_frequency,
-        False,
-        ax,
     )
     spot_sampling_schedule = perps.create_schedule(
         start_date, end_date, spot_sampling_frequency
@@ -174,16 +257,176 @@ def funding_periods(
         start_date, end_date, perp_sampling_frequency
     )
 
-    funding_periods = perps.compute_funding_periods(
+    spot_points = perps.evaluate_curve(
+        spot_curve, perps.to_timestamps(spot_sampling_schedule)
+    )
+    perp_points = perps.evaluate_curve(
+        perp_curve, perps.to_timestamps(perp_sampling_schedule)
+    )
+    funding_periods = perps.compute_funding_periods_from_samples(
         funding_schedule,
         spot_sampling_schedule,
+        spot_points,
         perp_sampling_schedule,
-        spot_curve,
-        perp_curve,
+        perp_points,
         interest_rate,
         clamp_lower_bound,
         clamp_upper_bound,
     )
+    return FundingData(
+        funding_periods,
+        spot_sampling_schedule,
+        spot_points,
+        perp_sampling_schedule,
+        perp_points,
+        spot_curve,
+        perp_curve,
+    )
+
+
+def iter_funding_data(
+    start_date: dt.datetime,
+    end_date: dt.datetime,
+    spot_curve: Any,
+    perp_curve: Any,
+    funding_payment_frequency: dt.timedelta,
+    spot_sampling_frequency: dt.timedelta,
+    perp_sampling_frequency: dt.timedelta,
+    interest_rate: float = 0,
+    clamp_lower_bound: float = 0,
+    clamp_upper_bound: float = 0,
+    step_size: int = 1_000_000,
+    cancelled: Any = None,
+):
+    """
+    compute_funding_data in steps of about step_size curve samples. After each step yields
+    the number of funding periods processed, the total number of periods and the funding data
+    up to there; the data of the last step matches compute_funding_data's (up to the rounding
+    of the TWAP cumulative sums). cancelled (e.g. a threading.Event) is checked between the
+    curve evaluations and TWAPs within each step, the iteration stops once it is set.
+    """
+    spot_curve = curves.compile_curve(spot_curve)
+    perp_curve = curves.compile_curve(perp_curve)
+
+    funding_schedule = perps.create_schedule(
+        start_date, end_date, funding_payment_frequency
+    )
+    spot_sampling_schedule = perps.create_schedule(
+        start_date, end_date, spot_sampling_frequency
+    )
+    perp_sampling_schedule = perps.create_schedule(
+        start_date, end_date, perp_sampling_frequency
+    )
+    boundaries = perps.to_timestamps(funding_schedule)
+    spot_times = perps.to_timestamps(spot_sampling_schedule)
+    perp_times = perps.to_timestamps(perp_sampling_schedule)
+    spot_points = np.empty(len(spot_times))
+    perp_points = np.empty(len(perp_times))
+    spot_done = 0
+    perp_done = 0
+
+    n_periods = len(funding_schedule) - 1
+    periods_per_step = max(
+        1,
+        int(
+            step_size
+            * min(spot_sampling_frequency, perp_sampling_frequency)
+            / funding_payment_frequency
+        ),
+    )
+    blocks = [perps.FundingPeriods().data]
+    for i in range(0, n_periods, periods_per_step):
+        j = min(i + periods_per_step, n_periods)
+        if cancelled is not None and cancelled.is_set():
+            return
+
+        # every sample is evaluated once (the last step takes the ones after the last
+        # period too), each step also needs the last sample before its first period
+        spot_end = (
+            np.searchsorted(spot_times, boundaries[j], "left")
+            if j < n_periods
+            else len(spot_times)
+        )
+        spot_points[spot_done:spot_end] = perps.evaluate_curve(
+            spot_curve, spot_times[spot_done:spot_end]
+        )
+        spot_done = max(spot_done, spot_end)
+        spot_start = max(np.searchsorted(spot_times, boundaries[i], "left") - 1, 0)
+        if cancelled is not None and cancelled.is_set():
+            return
+
+        perp_end = (
+            np.searchsorted(perp_times, boundaries[j], "left")
+            if j < n_periods
+            else len(perp_times)
+        )
+        perp_points[perp_done:perp_end] = perps.evaluate_curve(
+            perp_curve, perp_times[perp_done:perp_end]
+        )
+        perp_done = max(perp_done, perp_end)
+        perp_start = max(np.searchsorted(perp_times, boundaries[i], "left") - 1, 0)
+        if cancelled is not None and cancelled.is_set():
+            return
+
+        blocks.append(
+            perps.compute_funding_periods_from_samples(
+                funding_schedule[i : j + 1],
+                spot_times[spot_start:spot_end],
+                spot_points[spot_start:spot_end],
+                perp_times[perp_start:perp_end],
+                perp_points[perp_start:perp_end],
+                interest_rate,
+                clamp_lower_bound,
+                clamp_upper_bound,
+            ).data
+        )
+        yield j, n_periods, FundingData(
+            perps.FundingPeriods(np.concatenate(blocks)),
+            spot_sampling_schedule[:spot_done],
+            spot_points[:spot_done],
+            perp_sampling_schedule[:perp_done],
+            perp_points[:perp_done],
+            spot_curve,
+            perp_curve,
+        )
+
+
+def plot_funding_data(
+    data: FundingData,
+    start_date: dt.datetime,
+    end_date: dt.datetime,
+    show_funding_payment: bool = False,
+    show_funding_rate: bool = False,
+    show_spot_twap: bool = False,
+    show_perp_twap: bool = False,
+    show_spot_step: bool = False,
+    show_perp_step: bool = False,
+    show_spot_points: bool = False,
+    show_perp_points: bool = False,
+    zoom: Optional[List] = None,
+    show: bool = False,
+    plot_save_path: Optional[str] = None,
+    figure: Optional[Figure] = None,
+):
+    """
+    Plots funding data computed by compute_funding_data. When a figure is given the chart
+    is drawn on it (and saved from it) without touching the pyplot state, e.g. for a
+    headless export.
+    """
+    save = not plot_save_path is None
+    ax = None
+
+    if figure is not None:
+        ax = figure.subplots(1, 1)
+    else:
+        if show:
+            plt.ion()
+        else:
+            plt.ioff()
+            plt.clf()
+
+        if save or show:
+            _, ax = plt.subplots(1, 1, figsize=(15, 5))
 
     x_limit_left = None
     x_limit_right = None
@@ -194,22 +437,22 @@ def funding_periods(
             else:
                 zoom = (zoom[0], zoom[0] + 0.01)
 
-        s = start_date.timestamp()
-        e = end_date.timestamp()
+        s = perps.to_timestamps(start_date)
+        e = perps.to_timestamps(end_date)
         start = s + zoom[0] * (e - s)
         end = s + zoom[1] * (e - s)
-        x_limit_left = dt.datetime.fromtimestamp(start)
-        x_limit_right = dt.datetime.fromtimestamp(end)
+        x_limit_left = perps.to_datetime64(start)
+        x_limit_right = perps.to_datetime64(end)
 
     plots.plot_funding_periods(
         ax,
         start_date,
         end_date,
-        funding_periods,
-        spot_sampling_schedule,
-        perp_sampling_schedule,
-        spot_curve,
-        perp_curve,
+        data.funding_periods,
+        data.spot_sampling_schedule,
+        data.perp_sampling_schedule,
+        data.spot_curve,
+        data.perp_curve,
         x_limit_left=x_limit_left,
         x_limit_right=x_limit_right,
         show_spot_points=show_spot_points,
@@ -220,7 +463,72 @@ def funding_periods(
         show_perp_twap=show_perp_twap,
         show_funding_payment=show_funding_payment,
         show_funding_rate=show_funding_rate,
+        spot_points=data.spot_points,
+        perp_points=data.perp_points,
     )
 
+    if figure is not None:
+        if save:
+            figure.savefig(plot_save_path, bbox_inches="tight")
+        return
+
     if save:
         plt.savefig(plot_save_path, bbox_inches="tight")
+
+
+def funding_periods(
+    start_date: dt.datetime,
+    end_date: dt.datetime,
+    spot_curve: Any,
+    perp_curve: Any,
+    funding_payment_frequency: dt.timedelta,
+    spot_sampling_frequency: dt.timedelta,
+    perp_sampling_frequency: dt.timedelta,
+    interest_rate: float = 0,
+    clamp_lower_bound: float = 0,
+    clamp_upper_bound: float = 0,
+    show_funding_payment: bool = False,
+    show_funding_rate: bool = False,
+    show_spot_twap: bool = False,
+    show_perp_twap: bool = False,
+    show_spot_step: bool = False,
+    show_perp_step: bool = False,
+    show_spot_points: bool = False,
+    show_perp_points: bool = False,
+    zoom: Optional[List] = None,
+    show: bool = False,
+    plot_save_path: Optional[str] = None,
+    figure: Optional[Figure] = None,
+):
+    """
+    When a figure is given the chart is drawn on it (and saved from it) without
+    touching the pyplot state, e.g. for a headless export.
+    """
+    plot_funding_data(
+        compute_funding_data(
+            start_date,
+            end_date,
+            spot_curve,
+            perp_curve,
+            funding_payment_frequency,
+            spot_sampling_frequency,
+            perp_sampling_frequency,
+            interest_rate,
+            clamp_lower_bound,
+            clamp_upper_bound,
+        ),
+        start_date,
+        end_date,
+        show_funding_payment=show_funding_payment,
+        show_funding_rate=show_funding_rate,
+        show_spot_twap=show_spot_twap,
+        show_perp_twap=show_perp_twap,
+        show_spot_step=show_spot_step,
+        show_perp_step=show_perp_step,
+        show_spot_points=show_spot_points,
+        show_perp_points=show_perp_points,
+        zoom=zoom,
+        show=show,
+        plot_save_path=plot_save_path,
+        figure=figure,
+    )
@@ -0,0 +1,116 @@
+import numpy as np
+import modules.curves as curves
+import modules.perps as perps
+
+
+def impact_prices(prices, volumes, offsets, notional: float) -> np.ndarray:
+    """
+    Average fill price of trading the given notional against each book side.
+    The levels of all book sides are concatenated (best level first) with the
+    side i occupying [offsets[i], offsets[i+1]). The level at which the notional
+    is filled is found with a single searchsorted over the cumulative notional of
+    all levels. NaN is returned where the side is not deep enough.
+    """
+    prices = np.asarray(prices, dtype=float)
+    volumes = np.asarray(volumes, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if notional <= 0:
+        raise ValueError("notional must be positive")
+
+    cum_notional = np.concatenate(([0.0], np.cumsum(prices * volumes)))
+    cum_volume = np.concatenate(([0.0], np.cumsum(volumes)))
+    start = offsets[:-1]
+    stop = offsets[1:]
+    if len(prices) == 0:
+        return np.full(len(start), np.nan)
+
+    target = cum_notional[start] + notional
+    filled = cum_notional[stop] >= target
+    level = np.clip(np.searchsorted(cum_notional, target, "left"), start + 1, stop) - 1
+    level = np.maximum(level, 0)
+    volume = (
+        cum_volume[level]
+        - cum_volume[start]
+        + (target - cum_notional[level]) / np.where(filled, prices[level], 1)
+    )
+    return np.where(filled, notional / np.where(filled, volume, 1), np.nan)
+
+
+def grow(array: np.ndarray, size: int, capacity: int) -> np.ndarray:
+    """Copy of the first size values of array in a buffer of the given capacity."""
+    ret = np.empty(capacity, dtype=array.dtype)
+    ret[:size] = array[:size]
+    return ret
+
+
+class ImpactPriceEngine:
+    """
+    Impact bid and ask prices for a fixed notional over a stream of order-book snapshots.
+    Snapshots are buffered as flat level arrays and the impact prices of all snapshots
+    added since the last query are computed in one batch. Bids are expected best (highest)
+    first and asks best (lowest) first, each as a sequence of (price, volume) levels.
+    Timestamps and impact prices are kept in buffers which double when full and are
+    returned as views, so polling after every snapshot stays linear overall.
+    """
+
+    def __init__(self, notional: float, capacity: int = 1024):
+        if notional <= 0:
+            raise ValueError("notional must be positive")
+        self.notional = notional
+        self.size = 0
+        self.computed = 0
+        self.times = np.empty(max(1, capacity))
+        self.pending = {"bid": [], "ask": []}
+        self.impact = {
+            "bid": np.empty(len(self.times)),
+            "ask": np.empty(len(self.times)),
+        }
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.times[: self.size]
+
+    def add_snapshot(self, timestamp, bids, asks):
+        timestamp = perps.to_timestamps(timestamp)
+        if self.size > 0 and timestamp < self.times[self.size - 1]:
+            raise ValueError("snapshots must be in time order")
+        if self.size == len(self.times):
+            capacity = 2 * len(self.times)
+            self.times = grow(self.times, self.size, capacity)
+            for side in self.impact:
+                self.impact[side] = grow(self.impact[side], self.computed, capacity)
+        self.times[self.size] = timestamp
+        self.size += 1
+        self.pending["bid"].append(np.asarray(bids, dtype=float).reshape(-1, 2))
+        self.pending["ask"].append(np.asarray(asks, dtype=float).reshape(-1, 2))
+
+    def add_snapshots(self, timestamps, bids, asks):
+        for t, b, a in zip(timestamps, bids, asks):
+            self.add_snapshot(t, b, a)
+
+    def update(self):
+        if self.computed == self.size:
+            return
+        for side, books in self.pending.items():
+            levels = np.concatenate(books)
+            offsets = np.concatenate(([0], np.cumsum([len(x) for x in books])))
+            self.impact[side][self.computed : self.size] = impact_prices(
+                levels[:, 0], levels[:, 1], offsets, self.notional
+            )
+            books.clear()
+        self.computed = self.size
+
+    def impact_bid_prices(self) -> np.ndarray:
+        self.update()
+        return self.impact["bid"][: self.size]
+
+    def impact_ask_prices(self) -> np.ndarray:
+        self.update()
+        return self.impact["ask"][: self.size]
+
+    def impact_bid_curve(self) -> curves.StepCurve:
+        # the curve holds views of the buffers, later snapshots are written past them
+        return curves.StepCurve(self.timestamps, self.impact_bid_prices())
+
+    def impact_ask_curve(self) -> curves.StepCurve:
+        return curves.StepCurve(self.timestamps, self.impact_ask_prices())
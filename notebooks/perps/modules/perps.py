@@ -1,10 +1,13 @@
 import numpy as np
+import pandas as pd
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 from typing import List
 
 
 class FundingPeriod:
+    __slots__ = ("start", "end", "payment", "rate", "spot_twap", "perp_twap")
+
     def __init__(
         self,
         start: dt.datetime,
@@ -25,29 +28,287 @@ class FundingPeriod:
         return f"FundingPeriod({self.start} - {self.end}):\n\tpayment={self.payment}\n\trate={self.rate}\n\tspot(TWAP)={self.spot_twap}\n\tperp(TWAP)={self.perp_twap}\n"
 
 
+FUNDING_PERIOD_DTYPE = np.dtype(
+    [
+        ("start", "datetime64[us]"),
+        ("end", "datetime64[us]"),
+        ("payment", float),
+        ("rate", float),
+        ("spot_twap", float),
+        ("perp_twap", float),
+    ]
+)
+
+
+class FundingPeriods:
+    """
+    Columnar collection of funding periods backed by a structured array. Columns
+    (e.g. funding_periods.payment) are views of the array, indexing with an integer
+    returns a FundingPeriod and with a slice or mask another FundingPeriods.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: np.ndarray = None):
+        self.data = np.zeros(0, FUNDING_PERIOD_DTYPE) if data is None else data
+
+    @classmethod
+    def from_columns(
+        cls, start, end, payment, rate, spot_twap, perp_twap
+    ) -> "FundingPeriods":
+        data = np.empty(len(payment), FUNDING_PERIOD_DTYPE)
+        data["start"] = to_datetime64(start)
+        data["end"] = to_datetime64(end)
+        data["payment"] = payment
+        data["rate"] = rate
+        data["spot_twap"] = spot_twap
+        data["perp_twap"] = perp_twap
+        return cls(data)
+
+    @classmethod
+    def from_periods(cls, funding_periods) -> "FundingPeriods":
+        """Wraps a sequence of FundingPeriod, FundingPeriods are returned unchanged."""
+        if isinstance(funding_periods, cls):
+            return funding_periods
+        data = np.empty(len(funding_periods), FUNDING_PERIOD_DTYPE)
+        for i, fp in enumerate(funding_periods):
+            data[i] = (
+                to_datetime64(fp.start),
+                to_datetime64(fp.end),
+                fp.payment,
+                fp.rate,
+                fp.spot_twap,
+                fp.perp_twap,
+            )
+        return cls(data)
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.data["start"]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.data["end"]
+
+    @property
+    def payment(self) -> np.ndarray:
+        return self.data["payment"]
+
+    @property
+    def rate(self) -> np.ndarray:
+        return self.data["rate"]
+
+    @property
+    def spot_twap(self) -> np.ndarray:
+        return self.data["spot_twap"]
+
+    @property
+    def perp_twap(self) -> np.ndarray:
+        return self.data["perp_twap"]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            # rows carry datetimes and floats like the FundingPeriods built before
+            row = self.data[key]
+            return FundingPeriod(
+                to_datetime(row["start"]),
+                to_datetime(row["end"]),
+                float(row["payment"]),
+                float(row["rate"]),
+                float(row["spot_twap"]),
+                float(row["perp_twap"]),
+            )
+        return FundingPeriods(self.data[key])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __str__(self):
+        return "".join(str(fp) for fp in self)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.data[name] for name in self.data.dtype.names})
+
+
+def to_timestamps(values):
+    """
+    Converts datetimes, datetime64 values or epoch seconds into float epoch seconds.
+    Naive datetimes are read as UTC, like datetime64 values, whatever the local timezone.
+    """
+    if isinstance(values, dt.datetime):
+        if values.tzinfo is None:
+            values = values.replace(tzinfo=dt.timezone.utc)
+        return values.timestamp()
+    if isinstance(values, np.datetime64):
+        return values.astype("datetime64[us]").astype(np.int64) / 1e6
+    if np.isscalar(values):
+        return float(values)
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[us]").astype(np.int64) / 1e6
+    if values.dtype.kind == "O":
+        return np.fromiter(
+            (to_timestamps(x) for x in values), dtype=float, count=len(values)
+        )
+    return values.astype(float, copy=False)
+
+
+def to_datetime64(value) -> np.datetime64:
+    """
+    Converts a datetime, datetime64 value or epoch seconds (or an array of them)
+    into UTC datetime64[us]. Naive datetimes are taken as UTC wall-clock times.
+    """
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[us]")
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        return np.datetime64(value, "us")
+    if not np.isscalar(value):
+        values = np.asarray(value)
+        if values.dtype.kind == "M":
+            return values.astype("datetime64[us]")
+        micros = np.round(to_timestamps(values) * 1e6).astype(np.int64)
+        return micros.astype("datetime64[us]")
+    return np.datetime64(int(round(to_timestamps(value) * 1e6)), "us")
+
+
+def to_datetime(value) -> dt.datetime:
+    """Inverse of to_datetime64, returns a naive UTC datetime for anything but a datetime."""
+    if isinstance(value, dt.datetime):
+        return value
+    return to_datetime64(value).item()
+
+
 def create_schedule(
     start_date: dt.datetime, 
     end_date: dt.datetime, 
     time_step: dt.timedelta, 
     include_end_date: bool =False, ax=None
-    ) -> List[dt.datetime]:
-    if end_date < start_date:
+    ) -> np.ndarray:
+    """
+    Returns a datetime64[us] array with points spaced by time_step starting at start_date
+    and strictly before end_date (always containing start_date itself).
+    """
+    start = to_datetime64(start_date)
+    end = to_datetime64(end_date)
+    if end < start:
         raise ValueError("end date cannot be lower than start date")
 
-    schedule = np.array([start_date])
-    while True:
-        next_date = schedule[-1] + time_step
-        if next_date >= end_date:
-            break
-        schedule = np.append(schedule, next_date)
+    step = np.timedelta64(time_step, "us").astype(np.int64)
+    if step <= 0:
+        raise ValueError("time step must be positive")
+
+    duration = (end - start).astype(np.int64)
+    n = max(1, -(-duration // step))
+    schedule = start + (np.arange(n, dtype=np.int64) * step).astype("timedelta64[us]")
 
     if include_end_date:
-        schedule = np.append(schedule, end_date)
+        schedule = np.append(schedule, end)
 
     return schedule
 
 
-def twap(curve, curve_schedule: List[dt.datetime], start: dt.datetime, end: dt.datetime, weight_multiplier_increment: int = 0):
+def supports_arrays(curve) -> bool:
+    """Curves take arrays of epoch seconds unless they set supports_arrays = False."""
+    return getattr(curve, "supports_arrays", True)
+
+
+def evaluate_curve(curve, xs) -> np.ndarray:
+    """
+    Evaluates the curve over an array of epoch seconds, point by point for curves which
+    don't support arrays or return a single value for the whole array.
+    """
+    xs = np.asarray(xs, dtype=float)
+    if supports_arrays(curve):
+        ys = curve(xs)
+        if np.shape(ys) == xs.shape:
+            return np.asarray(ys, dtype=float)
+    return np.asarray([curve(x) for x in xs], dtype=float)
+
+
+def twaps_from_samples(
+    times, values, starts, ends, weight_multiplier_increment: int = 0
+) -> np.ndarray:
+    """
+    Computes the TWAP of a sampled curve (sorted observation times with their values) for every
+    [start, end) period at once, using cumulative sums and searchsorted period boundaries.
+    Follows the same rules as twap(): the last value observed before a period is carried into it,
+    the start is moved to the first observation if there is none before the period and
+    NaN is returned for periods which end before the first observation.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    starts = np.atleast_1d(np.asarray(starts, dtype=float))
+    ends = np.atleast_1d(np.asarray(ends, dtype=float))
+    if np.any(ends <= starts):
+        raise ValueError("end must be after start")
+
+    result = np.full(len(starts), np.nan)
+    n_times = len(times)
+    if n_times == 0:
+        return result
+
+    first = np.searchsorted(times, starts, "left")
+    count = np.searchsorted(times, ends, "left") - first
+
+    # no observations within the period: the last value before or at start still prevails
+    empty = count <= 0
+    last_before = np.searchsorted(times, starts, "right") - 1
+    carried = empty & (last_before >= 0)
+    result[carried] = values[last_before[carried]]
+
+    # cumulative sums over the intervals between consecutive observations, the second
+    # set weighted by the observation index so that linearly increasing weights can be recovered
+    inc = weight_multiplier_increment
+    durations = np.diff(times)
+    index = np.arange(n_times - 1)
+    cum_product = np.concatenate(([0.0], np.cumsum(values[:-1] * durations)))
+    cum_weight = np.concatenate(([0.0], np.cumsum(durations)))
+    cum_index_product = np.concatenate(
+        ([0.0], np.cumsum(index * values[:-1] * durations))
+    )
+    cum_index_weight = np.concatenate(([0.0], np.cumsum(index * durations)))
+
+    in_range = ~empty
+    f = first[in_range]
+    n = count[in_range]
+    s = starts[in_range]
+    e = ends[in_range]
+
+    # first segment: from start (or the first observation) with the last known value
+    start = np.where(f == 0, times[f], s)
+    first_value = np.where(f == 0, values[f], values[np.maximum(f - 1, 0)])
+    next_time = np.where(n > 1, times[np.minimum(f + 1, n_times - 1)], e)
+    w = next_time - start
+    sum_product = first_value * w
+    sum_weight = w
+
+    # full intervals between observations within the period, weight multiplier 1 + (j - f) * inc
+    lo = np.minimum(f + 1, n_times - 1)
+    hi = np.maximum(f + n - 1, lo)
+    base = 1 - f * inc
+    sum_product = sum_product + base * (cum_product[hi] - cum_product[lo])
+    sum_product = sum_product + inc * (cum_index_product[hi] - cum_index_product[lo])
+    sum_weight = sum_weight + base * (cum_weight[hi] - cum_weight[lo])
+    sum_weight = sum_weight + inc * (cum_index_weight[hi] - cum_index_weight[lo])
+
+    # last observation carried until the end of the period
+    last = f + n - 1
+    w = np.where(n > 1, (e - times[last]) * (1 + (n - 1) * inc), 0)
+    sum_product = sum_product + values[last] * w
+    sum_weight = sum_weight + w
+
+    result[in_range] = sum_product / sum_weight
+    return result
+
+
+def twap(curve, curve_schedule, start, end, weight_multiplier_increment: int = 0):
+    start = to_timestamps(start)
+    end = to_timestamps(end)
     if end <= start:
         raise ValueError("end must be after start")
 
@@ -57,46 +318,73 @@ def twap(curve, curve_schedule: List[dt.datetime], start: dt.datetime, end: dt.d
     if curve_schedule is None:
         raise ValueError("curve schedule must be specified")
 
-    indices = np.transpose(
-        np.argwhere(np.logical_and(curve_schedule >= start, curve_schedule < end))
+    return sampled_twap(
+        lambda xs: evaluate_curve(curve, xs),
+        curve_schedule,
+        start,
+        end,
+        weight_multiplier_increment,
+    )
+
+
+def sampled_twap(sample, schedule, start, end, weight_multiplier_increment: int = 0):
+    """
+    TWAP over [start, end) of the values returned by sample(times) for the schedule
+    points that matter: the ones within the period and the last one before it.
+    """
+    schedule = to_timestamps(schedule)
+    start = to_timestamps(start)
+    end = to_timestamps(end)
+    if len(schedule) == 0 or schedule[0] >= end:
+        # schedule starts later
+        return None
+
+    lo = max(np.searchsorted(schedule, start, "left") - 1, 0)
+    hi = max(
+        np.searchsorted(schedule, end, "left"),
+        np.searchsorted(schedule, start, "right"),
+    )
+    times = schedule[lo:hi]
+    return twaps_from_samples(
+        times, sample(times), start, end, weight_multiplier_increment
     )[0]
-    if len(indices) == 0:
-        if min(curve_schedule) > start:
-            # schedule starts later
-            return None
-        # the last value before or at start still prevails
-        return curve(
-            curve_schedule[np.transpose(np.argwhere(curve_schedule <= start))[0][-1]]
-        )
 
-    prev_value = curve(curve_schedule[indices[0]].timestamp())
-    if indices[0] == 0:
-        # move start to first available observation
-        start = curve_schedule[indices[0]]
-    else:
-        # use last known value
-        prev_value = curve(curve_schedule[indices[0] - 1].timestamp())
-
-    schedule_points_in_range = curve_schedule[indices]
-    prev_time = start.timestamp()
-    sum_product = 0
-    sum_weight = 0
-    weight_multiplier = 1
-    for p in schedule_points_in_range[1:]:
-        t = p.timestamp()
-        w = (t-prev_time)*weight_multiplier
-        sum_product += prev_value * w
-        sum_weight += w
-        weight_multiplier += weight_multiplier_increment
-        prev_value = curve(t)
-        prev_time = t
-    t = end.timestamp()
-    w = (t-prev_time)*weight_multiplier
-    sum_product += prev_value * w
-    sum_weight += w
-    return sum_product / sum_weight
-
-def compute_premium_index(impact_bid_curve, impact_ask_curve, price_index_curve, price_index_curve_schedule: List[dt.datetime], start: dt.datetime, end: dt.datetime, weight_multiplier_increment: int = 0):
+
+def compute_twaps(
+    curve, curve_schedule, funding_schedule, weight_multiplier_increment: int = 0
+) -> np.ndarray:
+    """
+    Returns the TWAP of the curve sampled at curve_schedule for each period between consecutive
+    points of the funding schedule (NaN where the sampling schedule starts after the period).
+    The curve is evaluated once over the whole sampling schedule.
+    """
+    if curve is None:
+        raise ValueError("curve must be specified")
+
+    if curve_schedule is None:
+        raise ValueError("curve schedule must be specified")
+
+    times = to_timestamps(curve_schedule)
+    boundaries = to_timestamps(funding_schedule)
+    return twaps_from_samples(
+        times,
+        evaluate_curve(curve, times),
+        boundaries[:-1],
+        boundaries[1:],
+        weight_multiplier_increment,
+    )
+
+def compute_premium_index(
+    impact_bid_curve,
+    impact_ask_curve,
+    price_index_curve,
+    price_index_curve_schedule,
+    start,
+    end,
+    weight_multiplier_increment: int = 0,
+):
+    start = to_timestamps(start)
+    end = to_timestamps(end)
     if end <= start:
         raise ValueError("end must be after start")
 
@@ -112,50 +400,66 @@ def compute_premium_index(impact_bid_curve, impact_ask_curve, price_index_curve,
     if price_index_curve_schedule is None:
         raise ValueError("price_index_curve_schedule schedule must be specified")
 
-    indices = np.transpose(
-        np.argwhere(np.logical_and(price_index_curve_schedule >= start, price_index_curve_schedule < end))
-    )[0]
-    if len(indices) == 0:
-        if min(price_index_curve_schedule) > start:
-            # schedule starts later
-            return None
-        # the last value before or at start still prevails
-        return premium_index_at_point(impact_bid_curve, impact_ask_curve, price_index_curve, price_index_curve_schedule[np.transpose(np.argwhere(price_index_curve_schedule <= start))[0][-1]]) 
-
-
-    prev_value = premium_index_at_point(impact_bid_curve, impact_ask_curve, price_index_curve, price_index_curve_schedule[indices[0]].timestamp())
-    if indices[0] == 0:
-        # move start to first available observation
-        start = price_index_curve_schedule[indices[0]]
-    else:
-        # use last known value
-        prev_value = premium_index_at_point(impact_bid_curve, impact_ask_curve, price_index_curve, price_index_curve_schedule[indices[0] - 1].timestamp())
-
-    schedule_points_in_range = price_index_curve_schedule[indices]
-    prev_time = start.timestamp()
-    sum_product = 0
-    sum_weight = 0
-    weight_multiplier = 1
-    for p in schedule_points_in_range[1:]:
-        t = p.timestamp()
-        w = (t-prev_time)*weight_multiplier
-        sum_product += prev_value * w
-        sum_weight += w
-        weight_multiplier += weight_multiplier_increment
-        prev_value = premium_index_at_point(impact_bid_curve, impact_ask_curve, price_index_curve, t)
-        prev_time = t
-    t = end.timestamp()
-    w = (t-prev_time)*weight_multiplier
-    sum_product += prev_value * w
-    sum_weight += w
-    return sum_product / sum_weight
+    return sampled_twap(
+        lambda xs: premium_index_at_point(
+            impact_bid_curve, impact_ask_curve, price_index_curve, xs
+        ),
+        price_index_curve_schedule,
+        start,
+        end,
+        weight_multiplier_increment,
+    )
+
+
+def compute_premium_indices(
+    impact_bid_curve,
+    impact_ask_curve,
+    price_index_curve,
+    price_index_curve_schedule,
+    funding_schedule,
+    weight_multiplier_increment: int = 0,
+) -> np.ndarray:
+    """
+    Average premium index for each period between consecutive points of the funding schedule
+    (NaN where the schedule starts after the period). All three curves are evaluated once over
+    the whole schedule and time-weighted with the same boundaries as compute_twaps.
+    """
+    times = to_timestamps(price_index_curve_schedule)
+    boundaries = to_timestamps(funding_schedule)
+    return twaps_from_samples(
+        times,
+        premium_index_at_point(
+            impact_bid_curve, impact_ask_curve, price_index_curve, times
+        ),
+        boundaries[:-1],
+        boundaries[1:],
+        weight_multiplier_increment,
+    )
+
+
+def premium_index(impact_bid, impact_ask, price_index):
+    # Premium Index (P) = [ Max(0, Impact Bid Price - Price Index ) - Max(0, Price Index - Impact Ask Price)] / Price Index
+    return (
+        np.maximum(0, np.subtract(impact_bid, price_index))
+        - np.maximum(0, np.subtract(price_index, impact_ask))
+    ) / price_index
+
 
 def premium_index_at_point(impact_bid_curve, impact_ask_curve, price_index_curve, point):
-    # Premium Index (P) = [ Max(0, Impact Bid Price - Price Index ) - Max(0, Price Index - Impact Ask Price)] / Price Index
-    price_index_at_point = price_index_curve(points)
-    if price_index_at_point is None:
-        return None
-    return (max(0,impact_bid_curve(point)-price_index_at_point) - max(0,price_index_at_point-impact_ask_curve(points))) / price_index_at_point
+    """Premium index at a point or, evaluating the curves once, over an array of points."""
+    if np.ndim(point) == 0:
+        price_index_at_point = price_index_curve(point)
+        if price_index_at_point is None:
+            return None
+        return premium_index(
+            impact_bid_curve(point), impact_ask_curve(point), price_index_at_point
+        )
+    return premium_index(
+        evaluate_curve(impact_bid_curve, point),
+        evaluate_curve(impact_ask_curve, point),
+        evaluate_curve(price_index_curve, point),
+    )
+
 
 def compute_funding_rate_from_premium_index(
     average_previum_index: float,
@@ -164,13 +468,19 @@ def compute_funding_rate_from_premium_index(
     clamp_lower_bound: float,
     clamp_upper_bound: float,
 ) -> float:
-    # Funding Rate (F) = Average Premium Index (P) + clamp (interest rate - Premium Index (P), 0.05%, -0.05%)
-    return average_previum_index +  min(
+    """
+    Funding Rate (F) = Average Premium Index (P) + clamp (interest rate - Premium Index (P), 0.05%, -0.05%)
+    Any of the arguments can be NumPy arrays broadcast together and the bounds can be infinite.
+    """
+    return np.add(
+        average_previum_index,
+        np.clip(
+            (1 + np.multiply(delta_t, interest_rate)) - np.asarray(average_previum_index),
+            clamp_lower_bound,
             clamp_upper_bound,
-            max(
-                clamp_lower_bound,
-                (1 + delta_t * interest_rate) - average_previum_index,
-            ))
+        ),
+    )[()]
+
 
 def compute_funding_payment(
     perp_twap: float,
@@ -180,17 +490,53 @@ def compute_funding_payment(
     clamp_lower_bound: float,
     clamp_upper_bound: float,
 ) -> float:
-    funding_payment = perp_twap - spot_twap
-    if clamp_lower_bound != 0 or clamp_upper_bound != 0:
-        x = (1 + delta_t * interest_rate) * spot_twap - perp_twap
-        funding_payment += min(
-            clamp_upper_bound * spot_twap,
-            max(
-                clamp_lower_bound * spot_twap,
-                (1 + delta_t * interest_rate) * spot_twap - perp_twap,
-            ),
+    """
+    Funding payment; any of the arguments can be NumPy arrays broadcast together and the
+    bounds (as fractions of the spot TWAP) can be infinite. With both bounds 0 the payment
+    is the difference of the TWAPs.
+    """
+    spot_twap = np.asarray(spot_twap)
+    return (
+        np.subtract(perp_twap, spot_twap)
+        + np.clip(
+            (1 + np.multiply(delta_t, interest_rate)) * spot_twap - perp_twap,
+            np.multiply(clamp_lower_bound, spot_twap),
+            np.multiply(clamp_upper_bound, spot_twap),
         )
-    return funding_payment
+    )[()]
+
+
+def funding_rate_response(
+    perp_price,
+    spot_price,
+    interest_rate: float,
+    clamp_lower_bound: float,
+    clamp_upper_bound: float,
+    scaling_factor: float = 1,
+    rate_lower_bound: float = -np.inf,
+    rate_upper_bound: float = np.inf,
+):
+    """
+    Funding rate over one period as a function of the perp and spot prices,
+    clamp(k * funding payment / spot, d, c) with k the scaling factor and
+    [d, c] the rate bounds, broadcast over all arguments (e.g. dense parameter grids).
+    """
+    return np.clip(
+        np.multiply(
+            scaling_factor,
+            compute_funding_payment(
+                perp_price,
+                spot_price,
+                interest_rate,
+                1,
+                clamp_lower_bound,
+                clamp_upper_bound,
+            )
+            / spot_price,
+        ),
+        rate_lower_bound,
+        rate_upper_bound,
+    )[()]
 
 
 def summarise(start, end, funding_periods, spot_curve, perp_curve):
@@ -202,7 +548,7 @@ def summarise(start, end, funding_periods, spot_curve, perp_curve):
 
     spot_rate_of_return = spot_curve(end) / spot_curve(start) - 1
 
-    sum_funding_payments = sum([x.payment for x in funding_periods])
+    sum_funding_payments = FundingPeriods.from_periods(funding_periods).payment.sum()
     perp_rate_of_return = (perp_curve(end) - sum_funding_payments) / perp_curve(
         start
     ) - 1
@@ -219,30 +565,451 @@ def compute_funding_periods(
     interest_rate=0,
     clamp_lower_bound=0,
     clamp_upper_bound=0,
-):
-    funding_periods = []
-    for i in range(0, len(funding_schedule) - 1):
-        start = funding_schedule[i]
-        end = funding_schedule[i + 1]
-        spot_twap = twap(spot_curve, spot_sampling_schedule, start, end)
-        perp_twap = twap(perp_curve, perp_sampling_schedule, start, end)
-
-        if spot_twap is None or perp_twap is None:
-            continue
-
-        delta_t = relativedelta(end, start).days / 365.25
-        funding_payment = compute_funding_payment(
-            perp_twap,
-            spot_twap,
-            interest_rate,
-            delta_t,
-            clamp_lower_bound,
-            clamp_upper_bound,
-        )
-        funding_rate = funding_payment / spot_twap
-        funding_periods.append(
-            FundingPeriod(
-                start, end, funding_payment, funding_rate, spot_twap, perp_twap
+) -> FundingPeriods:
+    return compute_funding_periods_from_samples(
+        funding_schedule,
+        spot_sampling_schedule,
+        evaluate_curve(spot_curve, to_timestamps(spot_sampling_schedule)),
+        perp_sampling_schedule,
+        evaluate_curve(perp_curve, to_timestamps(perp_sampling_schedule)),
+        interest_rate,
+        clamp_lower_bound,
+        clamp_upper_bound,
+    )
+
+
+def compute_funding_periods_from_samples(
+    funding_schedule,
+    spot_sampling_schedule,
+    spot_points,
+    perp_sampling_schedule,
+    perp_points,
+    interest_rate=0,
+    clamp_lower_bound=0,
+    clamp_upper_bound=0,
+) -> FundingPeriods:
+    """
+    compute_funding_periods for curves already evaluated over their sampling schedules,
+    so the sampled points can be reused (e.g. for plotting).
+    """
+    boundaries = to_timestamps(funding_schedule)
+    spot_twaps = twaps_from_samples(
+        to_timestamps(spot_sampling_schedule), spot_points, boundaries[:-1], boundaries[1:]
+    )
+    perp_twaps = twaps_from_samples(
+        to_timestamps(perp_sampling_schedule), perp_points, boundaries[:-1], boundaries[1:]
+    )
+
+    funding_schedule = to_datetime64(funding_schedule)
+    valid = ~(np.isnan(spot_twaps) | np.isnan(perp_twaps))
+    spot_twaps = spot_twaps[valid]
+    perp_twaps = perp_twaps[valid]
+    payments = compute_funding_payment(
+        perp_twaps,
+        spot_twaps,
+        interest_rate,
+        funding_period_year_fractions(funding_schedule)[valid],
+        clamp_lower_bound,
+        clamp_upper_bound,
+    )
+    return FundingPeriods.from_columns(
+        funding_schedule[:-1][valid],
+        funding_schedule[1:][valid],
+        payments,
+        payments / spot_twaps,
+        spot_twaps,
+        perp_twaps,
+    )
+
+
+def create_funding_period(
+    start,
+    end,
+    spot_twap,
+    perp_twap,
+    interest_rate=0,
+    clamp_lower_bound=0,
+    clamp_upper_bound=0,
+) -> FundingPeriod:
+    delta_t = relativedelta(to_datetime(end), to_datetime(start)).days / 365.25
+    funding_payment = compute_funding_payment(
+        perp_twap,
+        spot_twap,
+        interest_rate,
+        delta_t,
+        clamp_lower_bound,
+        clamp_upper_bound,
+    )
+    funding_rate = funding_payment / spot_twap
+    return FundingPeriod(
+        start, end, funding_payment, funding_rate, spot_twap, perp_twap
+    )
+
+
+def funding_period_year_fractions(funding_schedule) -> np.ndarray:
+    """delta_t of every period between consecutive points of the funding schedule."""
+    return np.array(
+        [
+            relativedelta(to_datetime(end), to_datetime(start)).days / 365.25
+            for start, end in zip(funding_schedule[:-1], funding_schedule[1:])
+        ]
+    )
+
+
+def sweep_funding_payments(
+    funding_schedule,
+    spot_curve,
+    perp_curve,
+    spot_sampling_schedules: dict,
+    perp_sampling_schedules: dict,
+    interest_rates=(0,),
+    clamp_lower_bounds=(0,),
+    clamp_upper_bounds=(0,),
+) -> pd.DataFrame:
+    """
+    Funding payments and rates for every funding period over the full grid of sampling
+    schedules (dicts of label -> schedule), interest rates and clamp bounds.
+    TWAPs are computed once per sampling schedule and the payments are then broadcast
+    over the parameter grid. Returns a frame indexed by period (start, end) with columns
+    labelled by quantity ("payment" or "rate"), spot sampling, perp sampling,
+    interest rate, lower bound and upper bound. Periods without TWAPs are NaN.
+    """
+    spot_labels = list(spot_sampling_schedules)
+    perp_labels = list(perp_sampling_schedules)
+    spot_twaps = np.array(
+        [
+            compute_twaps(spot_curve, spot_sampling_schedules[k], funding_schedule)
+            for k in spot_labels
+        ]
+    )
+    perp_twaps = np.array(
+        [
+            compute_twaps(perp_curve, perp_sampling_schedules[k], funding_schedule)
+            for k in perp_labels
+        ]
+    )
+    delta_t = funding_period_year_fractions(funding_schedule)
+
+    # axes: period, spot sampling, perp sampling, interest rate, lower bound, upper bound
+    spot = spot_twaps.T[:, :, None, None, None, None]
+    perp = perp_twaps.T[:, None, :, None, None, None]
+    payments = compute_funding_payment(
+        perp,
+        spot,
+        np.reshape(interest_rates, (1, 1, 1, -1, 1, 1)),
+        delta_t.reshape(-1, 1, 1, 1, 1, 1),
+        np.reshape(clamp_lower_bounds, (1, 1, 1, 1, -1, 1)),
+        np.reshape(clamp_upper_bounds, (1, 1, 1, 1, 1, -1)),
+    )
+    rates = payments / spot
+
+    n_periods = len(delta_t)
+    parameters = pd.MultiIndex.from_product(
+        [
+            spot_labels,
+            perp_labels,
+            list(interest_rates),
+            list(clamp_lower_bounds),
+            list(clamp_upper_bounds),
+        ],
+        names=[
+            "spot_sampling",
+            "perp_sampling",
+            "interest_rate",
+            "clamp_lower_bound",
+            "clamp_upper_bound",
+        ],
+    )
+    periods = pd.MultiIndex.from_arrays(
+        [funding_schedule[:-1], funding_schedule[1:]], names=["start", "end"]
+    )
+    return pd.concat(
+        {
+            "payment": pd.DataFrame(
+                payments.reshape(n_periods, -1), index=periods, columns=parameters
+            ),
+            "rate": pd.DataFrame(
+                rates.reshape(n_periods, -1), index=periods, columns=parameters
+            ),
+        },
+        axis=1,
+        names=["quantity"],
+    )
+
+
+def sample_at_frequencies(curve, start_date, end_date, frequencies) -> dict:
+    """
+    Samples the curve over create_schedule(start_date, end_date, f) for every frequency f,
+    returning a dict of f -> (epoch seconds, values). The curve is evaluated once over the
+    schedule with the greatest common step and the coarser schedules are strides of it
+    (unless that schedule would be larger than all of them together).
+    """
+    steps = {f: int(np.timedelta64(f, "us").astype(np.int64)) for f in frequencies}
+    step = int(np.gcd.reduce(list(steps.values())))
+    duration = int((to_datetime64(end_date) - to_datetime64(start_date)).astype(np.int64))
+    if -(-duration // step) > sum(-(-duration // s) for s in steps.values()):
+        return {
+            f: (times, evaluate_curve(curve, times))
+            for f, times in (
+                (f, to_timestamps(create_schedule(start_date, end_date, f)))
+                for f in frequencies
             )
+        }
+
+    times = to_timestamps(
+        create_schedule(start_date, end_date, dt.timedelta(microseconds=step))
+    )
+    values = evaluate_curve(curve, times)
+    return {
+        f: (times[:: s // step], values[:: s // step]) for f, s in steps.items()
+    }
+
+
+def funding_frequency_table(
+    start_date,
+    end_date,
+    spot_curve,
+    perp_curve,
+    funding_frequencies,
+    spot_sampling_frequencies,
+    perp_sampling_frequencies,
+    interest_rate=0,
+    clamp_lower_bound=0,
+    clamp_upper_bound=0,
+) -> pd.DataFrame:
+    """
+    summarise() of the funding periods between start_date and end_date for every combination
+    of funding frequency, spot sampling frequency and perp sampling frequency.
+    Each curve is sampled once (see sample_at_frequencies) and the TWAPs for all the funding
+    frequencies come from a single twaps_from_samples call per sampling frequency.
+    """
+    funding_schedules = [
+        to_timestamps(create_schedule(start_date, end_date, f))
+        for f in funding_frequencies
+    ]
+    starts = np.concatenate([s[:-1] for s in funding_schedules])
+    ends = np.concatenate([s[1:] for s in funding_schedules])
+    splits = np.cumsum([len(s) - 1 for s in funding_schedules])[:-1]
+
+    spot_twaps = {
+        f: np.split(twaps_from_samples(times, values, starts, ends), splits)
+        for f, (times, values) in sample_at_frequencies(
+            spot_curve, start_date, end_date, spot_sampling_frequencies
+        ).items()
+    }
+    perp_twaps = {
+        f: np.split(twaps_from_samples(times, values, starts, ends), splits)
+        for f, (times, values) in sample_at_frequencies(
+            perp_curve, start_date, end_date, perp_sampling_frequencies
+        ).items()
+    }
+
+    spot_start, spot_end = evaluate_curve(
+        spot_curve, to_timestamps([start_date, end_date])
+    )
+    perp_start, perp_end = evaluate_curve(
+        perp_curve, to_timestamps([start_date, end_date])
+    )
+    spot_rr = spot_end / spot_start - 1
+
+    rows = []
+    for i, ff in enumerate(funding_frequencies):
+        delta_t = funding_period_year_fractions(funding_schedules[i])
+        for sf in spot_sampling_frequencies:
+            for pf in perp_sampling_frequencies:
+                spot = spot_twaps[sf][i]
+                perp = perp_twaps[pf][i]
+                valid = ~(np.isnan(spot) | np.isnan(perp))
+                sum_payments = compute_funding_payment(
+                    perp[valid],
+                    spot[valid],
+                    interest_rate,
+                    delta_t[valid],
+                    clamp_lower_bound,
+                    clamp_upper_bound,
+                ).sum()
+                perp_rr = (perp_end - sum_payments) / perp_start - 1
+                rows.append([ff, pf, sf, spot_rr, perp_rr, sum_payments])
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "funding_frequency",
+            "perp_frequency",
+            "spot_frequency",
+            "spot_rr",
+            "perp_rr",
+            "sum_payments",
+        ],
+    )
+
+
+class TwapAccumulator:
+    """
+    Running TWAP of a single observation feed over consecutive periods, following the
+    same rules and weighting as twap(). Observations must arrive in time order.
+    """
+
+    def __init__(self, weight_multiplier_increment: int = 0):
+        self.weight_multiplier_increment = weight_multiplier_increment
+        self.last_time = None
+        self.last_value = None
+        self.start_period(None)
+
+    def start_period(self, start):
+        self.start = start
+        self.carried_value = self.last_value
+        self.count = 0
+        self.segment_start = None
+        self.segment_value = None
+        self.weight_multiplier = 1
+        self.sum_product = 0
+        self.sum_weight = 0
+
+    def observe(self, t: float, value: float):
+        if self.last_time is not None and t < self.last_time:
+            raise ValueError("observations must be in time order")
+        if self.start is not None and t < self.start:
+            # observations before the first period are carried into it
+            self.carried_value = value
+        elif self.start is not None:
+            if self.count == 0:
+                if self.carried_value is None:
+                    # move start to first available observation
+                    self.segment_start = t
+                    self.segment_value = value
+                else:
+                    # use last known value
+                    self.segment_start = self.start
+                    self.segment_value = self.carried_value
+            else:
+                w = (t - self.segment_start) * self.weight_multiplier
+                self.sum_product += self.segment_value * w
+                self.sum_weight += w
+                self.weight_multiplier += self.weight_multiplier_increment
+                self.segment_start = t
+                self.segment_value = value
+            self.count += 1
+        self.last_time = t
+        self.last_value = value
+
+    def close_period(self, end: float):
+        """Returns the TWAP over [start, end) and starts the next period at end."""
+        if self.count == 0:
+            result = self.carried_value
+        else:
+            w = (end - self.segment_start) * self.weight_multiplier
+            result = (self.sum_product + self.segment_value * w) / (
+                self.sum_weight + w
+            )
+        self.start_period(end)
+        return result
+
+
+class FundingEngine:
+    """
+    Incremental funding period calculator for live spot and perp feeds.
+    Observations are added one at a time or in mini-batches (in time order per feed)
+    at O(1) cost each. A FundingPeriod is returned once both feeds have crossed its
+    end or advance() has been called past it.
+    """
+
+    def __init__(
+        self,
+        start_date,
+        funding_payment_frequency: dt.timedelta,
+        interest_rate=0,
+        clamp_lower_bound=0,
+        clamp_upper_bound=0,
+        weight_multiplier_increment: int = 0,
+    ):
+        # period boundaries in integer microseconds, as in create_schedule
+        self.start_us = int(to_datetime64(start_date).astype(np.int64))
+        self.frequency_us = int(
+            np.timedelta64(funding_payment_frequency, "us").astype(np.int64)
+        )
+        if self.frequency_us <= 0:
+            raise ValueError("funding payment frequency must be positive")
+        self.interest_rate = interest_rate
+        self.clamp_lower_bound = clamp_lower_bound
+        self.clamp_upper_bound = clamp_upper_bound
+        self.spot = TwapAccumulator(weight_multiplier_increment)
+        self.perp = TwapAccumulator(weight_multiplier_increment)
+        self.spot.start_period(self.boundary_timestamp(0))
+        self.perp.start_period(self.boundary_timestamp(0))
+        self.spot_twaps = {}
+        self.perp_twaps = {}
+        self.spot_period = 0
+        self.perp_period = 0
+        self.next_period = 0
+
+    def boundary(self, i: int) -> np.datetime64:
+        return np.datetime64(self.start_us + i * self.frequency_us, "us")
+
+    def boundary_timestamp(self, i: int) -> float:
+        return (self.start_us + i * self.frequency_us) / 1e6
+
+    def add_spot_observations(self, timestamps, values) -> List[FundingPeriod]:
+        self.spot_period = self.add_observations(
+            self.spot, self.spot_twaps, self.spot_period, timestamps, values
+        )
+        return self.emit()
+
+    def add_perp_observations(self, timestamps, values) -> List[FundingPeriod]:
+        self.perp_period = self.add_observations(
+            self.perp, self.perp_twaps, self.perp_period, timestamps, values
+        )
+        return self.emit()
+
+    def advance(self, timestamp) -> List[FundingPeriod]:
+        """Closes the periods ending at or before timestamp for both feeds."""
+        t = to_timestamps(timestamp)
+        self.spot_period = self.close_periods(
+            self.spot, self.spot_twaps, self.spot_period, t
         )
-    return funding_periods
+        self.perp_period = self.close_periods(
+            self.perp, self.perp_twaps, self.perp_period, t
+        )
+        return self.emit()
+
+    def add_observations(self, accumulator, twaps, period, timestamps, values):
+        timestamps = np.atleast_1d(to_timestamps(timestamps))
+        values = np.atleast_1d(values)
+        if len(timestamps) != len(values):
+            raise ValueError("timestamps and values must have the same length")
+        for t, v in zip(timestamps, values):
+            period = self.close_periods(accumulator, twaps, period, t)
+            accumulator.observe(t, v)
+        return period
+
+    def close_periods(self, accumulator, twaps, period, t):
+        end = self.boundary_timestamp(period + 1)
+        while end <= t:
+            twaps[period] = accumulator.close_period(end)
+            period += 1
+            end = self.boundary_timestamp(period + 1)
+        return period
+
+    def emit(self) -> List[FundingPeriod]:
+        funding_periods = []
+        while self.next_period in self.spot_twaps:
+            i = self.next_period
+            if i not in self.perp_twaps:
+                break
+            spot_twap = self.spot_twaps.pop(i)
+            perp_twap = self.perp_twaps.pop(i)
+            self.next_period += 1
+            if spot_twap is None or perp_twap is None:
+                continue
+            funding_periods.append(
+                create_funding_period(
+                    to_datetime(self.boundary(i)),
+                    to_datetime(self.boundary(i + 1)),
+                    spot_twap,
+                    perp_twap,
+                    self.interest_rate,
+                    self.clamp_lower_bound,
+                    self.clamp_upper_bound,
+                )
+            )
+        return funding_periods
@@ -6,14 +6,14 @@ from matplotlib.patches import Patch
 
 
 def plot_curve(curve, ax, start_date, end_date, add_labels):
-    xs = np.arange(start_date.timestamp(), end_date.timestamp(), 120)
+    xs = np.arange(perps.to_timestamps(start_date), perps.to_timestamps(end_date), 120)
     ax.plot(xs, curve(xs), label="simple curve")
 
     format_axis(ax)
 
     if add_labels:
-        start = start_date.timestamp()
-        end = end_date.timestamp()
+        start = perps.to_timestamps(start_date)
+        end = perps.to_timestamps(end_date)
         ax.text(
             start,
             curve(start),
@@ -33,14 +33,14 @@ def plot_curve(curve, ax, start_date, end_date, add_labels):
 def plot_curve_difference(
     ax, perp_curve, spot_curve, start_date, end_date, relative_difference=False
 ):
-    xs = np.arange(start_date.timestamp(), end_date.timestamp(), 120)
-    ys = []
+    xs = np.arange(perps.to_timestamps(start_date), perps.to_timestamps(end_date), 120)
+    spot = spot_curve(xs)
+    ys = perp_curve(xs) - spot
     label = ""
     if relative_difference:
-        ys = [(perp_curve(x) - spot_curve(x)) / spot_curve(x) for x in xs]
+        ys = ys / spot
         label = r"$\frac{perp - spot}{spot}$"
     else:
-        ys = [(perp_curve(x) - spot_curve(x)) for x in xs]
         label = "perp - spot"
     ax.plot(xs, ys, "-", label=label)
     format_x_axis_timestamp_to_date(ax)
@@ -54,7 +54,10 @@ def format_axis(ax):
 def format_x_axis_timestamp_to_date(ax):
     ax.set_xticks(ax.get_xticks().tolist()[1:-1])  # needed to suppress the warning
     ax.set_xticklabels(
-        [dt.datetime.fromtimestamp(x).strftime("%B %d") for x in ax.get_xticks()]
+        [
+            dt.datetime.fromtimestamp(x, dt.timezone.utc).strftime("%B %d")
+            for x in ax.get_xticks()
+        ]
     )
 
 
@@ -76,6 +79,47 @@ def add_labels(dates, values, labels, ax, min_date=None, max_date=None):
             )
 
 
+def decimate(xs, ys, buckets):
+    """
+    Reduces points sorted by x to the first and last points and the minimum and maximum
+    of each of the given number of equal-width x buckets (e.g. one per pixel), in their
+    original order, so that a line through them looks the same on screen.
+    """
+    if len(xs) <= 2 * buckets + 2:
+        return xs, ys
+    ts = perps.to_timestamps(xs)
+    ys = np.asarray(ys)
+    span = ts[-1] - ts[0]
+    if span <= 0:
+        return xs, ys
+    bucket = np.minimum(((ts - ts[0]) * (buckets / span)).astype(np.int64), buckets - 1)
+    order = np.lexsort((ys, bucket))
+    edges = np.flatnonzero(np.diff(bucket[order])) + 1
+    firsts = np.concatenate(([0], edges))
+    lasts = np.concatenate((edges - 1, [len(order) - 1]))
+    keep = np.unique(np.concatenate(([0, len(ts) - 1], order[firsts], order[lasts])))
+    return np.asarray(xs)[keep], ys[keep]
+
+
+def window(xs, ys, left=None, right=None):
+    """
+    Points sorted by x between left and right (either can be None), keeping the nearest
+    point outside each limit so that lines through them still reach the edges.
+    """
+    xs = np.asarray(xs)
+    ts = perps.to_timestamps(xs)
+    lo, hi = 0, len(ts)
+    if left is not None:
+        lo = max(np.searchsorted(ts, perps.to_timestamps(left), "left") - 1, 0)
+    if right is not None:
+        hi = min(np.searchsorted(ts, perps.to_timestamps(right), "right") + 1, hi)
+    return xs[lo:hi], np.asarray(ys)[lo:hi]
+
+
+# sampled points are drawn one marker per sample up to this many points in view
+MAX_MARKERS = 20_000
+
+
 def plot_funding_periods(
     ax,
     start_date,
@@ -95,35 +139,51 @@ def plot_funding_periods(
     show_perp_twap=False,
     show_funding_payment=False,
     show_funding_rate=False,
+    spot_points=None,
+    perp_points=None,
 ):
-    funding_periods_for_chart = funding_periods
-    extra_point = funding_periods[-1]
-    funding_periods_for_chart.append(
-        perps.FundingPeriod(
-            extra_point.end,
-            extra_point.end,
-            extra_point.payment,
-            extra_point.rate,
-            extra_point.spot_twap,
-            extra_point.perp_twap,
+    """
+    spot_points and perp_points are the curves sampled over their sampling schedules, as used
+    for the TWAPs; the curves are only evaluated when they are not given.
+    """
+    periods = perps.FundingPeriods.from_periods(funding_periods)
+    # the TWAP steps and period lines are drawn up to the end of the last period
+    chart_starts = np.append(periods.start, periods.end[-1:])
+
+    if spot_points is None:
+        spot_points = perps.evaluate_curve(
+            spot_curve, perps.to_timestamps(spot_sampling_schedule)
+        )
+    if perp_points is None:
+        perp_points = perps.evaluate_curve(
+            perp_curve, perps.to_timestamps(perp_sampling_schedule)
         )
+    # only the zoomed window is drawn, with the lines decimated to its pixel width
+    spot_sampling_schedule, spot_points = window(
+        spot_sampling_schedule, spot_points, x_limit_left, x_limit_right
+    )
+    perp_sampling_schedule, perp_points = window(
+        perp_sampling_schedule, perp_points, x_limit_left, x_limit_right
+    )
+    buckets = int(np.ceil(ax.get_window_extent().width))
+    spot_step_schedule, spot_step_points = decimate(
+        spot_sampling_schedule, spot_points, buckets
+    )
+    perp_step_schedule, perp_step_points = decimate(
+        perp_sampling_schedule, perp_points, buckets
     )
-
-    spot_points = spot_curve([x.timestamp() for x in spot_sampling_schedule])
-    perp_points = perp_curve([x.timestamp() for x in perp_sampling_schedule])
 
     if show_spot_points:
         ax.plot(
-            spot_sampling_schedule,
-            spot_points,
+            *decimate(spot_sampling_schedule, spot_points, MAX_MARKERS // 2 - 1),
             "x",
             color="green",
             label="spot: sampled points",
         )
     if show_spot_step:
         ax.step(
-            spot_sampling_schedule,
-            spot_points,
+            spot_step_schedule,
+            spot_step_points,
             "--",
             where="post",
             color="green",
@@ -131,8 +191,8 @@ def plot_funding_periods(
         )
     if show_spot_twap:
         ax.step(
-            [x.start for x in funding_periods_for_chart],
-            [x.spot_twap for x in funding_periods_for_chart],
+            chart_starts,
+            np.append(periods.spot_twap, periods.spot_twap[-1:]),
             where="post",
             color="green",
             label="spot: TWAP",
@@ -141,16 +201,15 @@ def plot_funding_periods(
 
     if show_perp_points:
         ax.plot(
-            perp_sampling_schedule,
-            perp_points,
+            *decimate(perp_sampling_schedule, perp_points, MAX_MARKERS // 2 - 1),
             "*",
             color="purple",
             label="perp: sampled points",
         )
     if show_perp_step:
         ax.step(
-            perp_sampling_schedule,
-            perp_points,
+            perp_step_schedule,
+            perp_step_points,
             "--",
             where="post",
             color="purple",
@@ -158,8 +217,8 @@ def plot_funding_periods(
         )
     if show_perp_twap:
         ax.step(
-            [x.start for x in funding_periods_for_chart],
-            [x.perp_twap for x in funding_periods_for_chart],
+            chart_starts,
+            np.append(periods.perp_twap, periods.perp_twap[-1:]),
             where="post",
             color="purple",
             label="perp: TWAP",
@@ -176,8 +235,8 @@ def plot_funding_periods(
         colour = "cadetblue"
         ax2.axhline(y=0, alpha=0.25, color=colour, lw=0.6)
         ax2.bar(
-            [x.end for x in funding_periods],
-            [x.payment for x in funding_periods],
+            periods.end,
+            periods.payment,
             color=colour,
             width=0.3,
             alpha=0.8,
@@ -190,9 +249,9 @@ def plot_funding_periods(
 
         if show_funding_rate:
             add_labels(
-                [x.end for x in funding_periods],
-                [x.payment for x in funding_periods],
-                [x.rate for x in funding_periods],
+                periods.end,
+                periods.payment,
+                periods.rate,
                 ax2,
                 x_limit_left,
                 x_limit_right,
@@ -207,8 +266,8 @@ def plot_funding_periods(
         colour = "orange"
         ax2.axhline(y=0, alpha=0.25, color=colour, lw=0.6)
         ax2.bar(
-            [x.end for x in funding_periods],
-            [x.rate for x in funding_periods],
+            periods.end,
+            periods.rate,
             color=colour,
             width=0.3,
             alpha=0.8,
@@ -221,7 +280,7 @@ def plot_funding_periods(
 
     y_min, y_max = ax.get_ylim()
     ax.vlines(
-        x=[x.end for x in funding_periods_for_chart],
+        x=periods.end,
         ymin=y_min,
         ymax=y_max,
         colors="black",
@@ -246,7 +305,7 @@ def plot_funding_periods(
             ax.set_xlim(right=min(x_max, right))
 
     spot_rr, perp_rr, sum_funding_payments = perps.summarise(
-        start_date, end_date, funding_periods, spot_curve, perp_curve
+        start_date, end_date, periods, spot_curve, perp_curve
     )
     txt = f"metrics for position of size 1:\n  {'sum of payments':<19} = {sum_funding_payments:,.0f}\n  {'perp rate of return':<21} = {perp_rr:0.3%}\n  {'spot rate of return':<21} = {spot_rr:0.3%}"
     ax.get_figure().text(
@@ -0,0 +1,64 @@
+import modules.backtest as backtest
+import modules.curves as curves
+import modules.perps as perps
+import datetime as dt
+import numpy as np
+
+
+def write_prices(path, start, days, drift):
+    points = perps.to_timestamps(start) + np.arange(0, days * 86400, 300)
+    prices = 100 + drift * np.arange(len(points)) + np.sin(points / 7200)
+    path.write_text(
+        "date,price\n"
+        + "\n".join(f"{float(x)!r},{float(y)!r}" for x, y in zip(points, prices))
+    )
+    return str(path)
+
+
+def test_run_backtests(tmp_path):
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 4)
+    spot_path = write_prices(tmp_path / "spot.csv", start, 3, 0.01)
+    perp_path = write_prices(tmp_path / "perp.csv", start, 3, 0.02)
+
+    scenarios = [
+        backtest.Scenario(
+            market,
+            spot_path,
+            perp_path,
+            start,
+            end,
+            dt.timedelta(hours=8),
+            dt.timedelta(minutes=sampling),
+            dt.timedelta(minutes=5),
+            interest_rate=0.1,
+            clamp_lower_bound=lb,
+            clamp_upper_bound=-lb,
+        )
+        for market in ["a", "b"]
+        for sampling in [5, 60]
+        for lb in [0, -0.0005]
+    ]
+
+    df = backtest.run_backtests(scenarios, max_workers=2)
+    assert list(df.columns) == backtest.COLUMNS
+    assert len(df) == len(scenarios) * 9
+    assert df.equals(backtest.run_backtests(scenarios, max_workers=1))
+
+    scenario = scenarios[-1]
+    rows = df[
+        (df.market == scenario.market)
+        & (df.spot_sampling_frequency == scenario.spot_sampling_frequency)
+        & (df.clamp_lower_bound == scenario.clamp_lower_bound)
+    ]
+    expected = perps.compute_funding_periods(
+        perps.create_schedule(start, end, dt.timedelta(hours=8), True),
+        perps.create_schedule(start, end, scenario.spot_sampling_frequency),
+        perps.create_schedule(start, end, scenario.perp_sampling_frequency),
+        curves.create_curve_from_file(spot_path),
+        curves.create_curve_from_file(perp_path),
+        0.1,
+        scenario.clamp_lower_bound,
+        scenario.clamp_upper_bound,
+    )
+    assert np.allclose(rows.payment, [x.payment for x in expected], atol=1e-9)
@@ -1,3 +1,4 @@
+import os
 import modules.perps as perps
 import modules.curves as curves
 import scipy.interpolate as interp
@@ -107,3 +108,180 @@ def test_superimposed_curve():
     for x in xs:
         assert curve_1(x) + curve_2(x) == test_curve_1(x)
         assert test_curve_1(x) == test_curve_2(x)
+
+
+def test_array_evaluation_matches_scalar_evaluation():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 6, 1)
+    points = np.linspace(perps.to_timestamps(start), perps.to_timestamps(end), 50)
+    base = interp.Akima1DInterpolator(points, 100 + 10 * np.sin(points / 1e5))
+
+    curve = curves.SuperimposedCurve(
+        curves.TransformedCurve(
+            curves.FlatExtensionCurve(base),
+            base_curve_scaling_factor=1.5,
+            horizontal_shift=3600,
+            vertical_shift=-20,
+        ),
+        curves.SimpleCurveBetweenDates(start, end, 10, 0.25),
+    )
+
+    schedule = perps.create_schedule(
+        start - dt.timedelta(days=2), end + dt.timedelta(days=2), dt.timedelta(hours=1)
+    )
+    xs = perps.to_timestamps(schedule)
+    expected = np.array([curve(x) for x in xs])
+
+    assert np.allclose(curve(xs), expected, rtol=0, atol=1e-9)
+    assert np.allclose(curve(list(xs)), expected, rtol=0, atol=1e-9)
+    assert np.allclose(curve(schedule), expected, rtol=0, atol=1e-9)
+    assert abs(curve(schedule[5]) - expected[5]) < 1e-9
+    assert abs(curve(perps.to_datetime(schedule[5])) - expected[5]) < 1e-9
+
+
+def test_compiled_curve_matches_curve_tree():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 6, 1)
+    points = np.linspace(perps.to_timestamps(start), perps.to_timestamps(end), 50)
+    base = curves.FlatExtensionCurve(
+        interp.Akima1DInterpolator(points, 100 + 10 * np.sin(points / 1e5))
+    )
+    simple = curves.SimpleCurveBetweenDates(start, end, 10, 0.25)
+
+    tree = curves.SuperimposedCurve(
+        curves.TransformedCurve(
+            curves.SuperimposedCurve(
+                curves.TransformedCurve(base, 2, horizontal_shift=60),
+                curves.TransformedCurve(simple, -3, 7, 11),
+            ),
+            base_curve_scaling_factor=1.5,
+            horizontal_shift=3600,
+            vertical_shift=-20,
+        ),
+        curves.SuperimposedCurve(
+            curves.TransformedCurve(base, 0.5, horizontal_shift=3660), None
+        ),
+    )
+    compiled = curves.compile_curve(tree)
+
+    # affine chains collapse into a single term per distinct leaf and shift
+    assert len(compiled.terms) == 1
+    assert compiled.terms[0][0] == 3.5
+
+    xs = perps.to_timestamps(
+        perps.create_schedule(
+            start - dt.timedelta(days=2),
+            end + dt.timedelta(days=2),
+            dt.timedelta(minutes=17),
+        )
+    )
+    assert np.allclose(compiled(xs), tree(xs), rtol=1e-12)
+    assert abs(compiled(start) - tree(start)) < 1e-9
+
+    leaf = lambda x: 2 * x
+    compiled = curves.compile_curve(curves.TransformedCurve(leaf, 3, 1, 2))
+    assert compiled(5) == 3 * leaf(5 - 1) + 2
+
+
+def test_grid_curve_point_limit():
+    curve = lambda x: np.sin(np.asarray(x) / 300)
+    grid = curves.GridCurve(
+        curve, 0, 86400, step=60, tolerance=1e-3, max_points=10**5
+    )
+    assert grid.error <= 1e-3
+    assert len(grid.ys) <= 10**5
+
+    # a tolerance only reachable below the limit's step raises instead of allocating
+    with pytest.raises(ValueError):
+        curves.GridCurve(curve, 0, 86400, step=60, tolerance=1e-9, max_points=20000)
+    with pytest.raises(ValueError):
+        curves.GridCurve(curve, 0, 90 * 86400, step=1, max_points=10**6)
+
+
+def test_grid_curve_from_file(tmp_path):
+    points = np.arange(0, 86400, 60)
+    prices = 100 + np.sin(points / 3600) + 0.01 * np.cos(points / 60)
+    file = tmp_path / "prices.csv"
+    file.write_text(
+        "date,price\n" + "\n".join(f"{x},{y}" for x, y in zip(points, prices))
+    )
+
+    exact = curves.create_curve_from_file(str(file), 2, 30, 1)
+    gridded = curves.create_curve_from_file(
+        str(file), 2, 30, 1, grid_step=120, tolerance=1e-4
+    )
+    assert gridded.curve.error <= 1e-4
+    assert gridded.curve.step < 120
+
+    xs = np.linspace(-1000, 90000, 10001)
+    assert np.max(np.abs(exact(xs) - gridded(xs))) <= 2 * 2e-4
+    assert abs(exact(1234.5) - gridded(1234.5)) <= 2 * 2e-4
+
+    # cached by path and modification time
+    again = curves.create_curve_from_file(str(file), grid_step=120, tolerance=1e-4)
+    assert again.curve is gridded.curve
+
+    file.write_text(
+        "date,price\n" + "\n".join(f"{x},{2 * y}" for x, y in zip(points, prices))
+    )
+    os.utime(file, (1, 1))
+    reloaded = curves.create_curve_from_file(str(file), grid_step=120, tolerance=1e-4)
+    assert reloaded.curve is not gridded.curve
+    assert abs(reloaded(0) - 2 * prices[0]) < 1e-9
+
+
+def test_price_data_cache(tmp_path, monkeypatch):
+    file = tmp_path / "prices.csv"
+    file.write_text(
+        "date,price,volume\n"
+        + "\n".join(f"{60 * i},{100 + i},{i % 20}" for i in range(1000))
+    )
+
+    timestamps, prices = curves.load_price_data(str(file))
+    assert os.path.exists(curves.price_data_cache_path(str(file)))
+    assert len(timestamps) == len(prices) == 950
+    assert np.all(prices - timestamps / 60 == 100)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached file should not be parsed")
+
+    with monkeypatch.context() as m:
+        m.setattr(curves.pd, "read_csv", fail)
+        cached_timestamps, cached_prices = curves.load_price_data(str(file))
+    assert isinstance(cached_timestamps.base, np.memmap)
+    assert np.array_equal(cached_timestamps, timestamps)
+    assert np.array_equal(cached_prices, prices)
+
+    # a rewrite within the same modification time tick is caught by the size
+    source = os.stat(file)
+    file.write_text("date,price\n0,1\n60,2\n120,3")
+    os.utime(file, ns=(source.st_atime_ns, source.st_mtime_ns))
+    timestamps, prices = curves.load_price_data(str(file))
+    assert np.array_equal(prices, [1, 2, 3])
+
+
+def test_streaming_file_curve_matches_global_interpolation(tmp_path):
+    rng = np.random.default_rng(7)
+    points = np.cumsum(rng.uniform(1, 5, 1000))
+    prices = 100 + np.cumsum(rng.normal(0, 1, 1000))
+    file = tmp_path / "prices.csv"
+    file.write_text(
+        "date,price\n"
+        + "\n".join(f"{float(x)!r},{float(y)!r}" for x, y in zip(points, prices))
+    )
+
+    expected = curves.FlatExtensionCurve(interp.Akima1DInterpolator(points, prices))
+    curve = curves.StreamingFileCurve(
+        str(file), chunk_size=64, overlap=4, max_segments=2
+    )
+    assert len(curve.segments) == 0
+    assert curve.min == pytest.approx(prices.min())
+    assert curve.max == pytest.approx(prices.max())
+
+    xs = np.linspace(points[0] - 100, points[-1] + 100, 5000)
+    assert np.allclose(curve(xs), expected(xs), rtol=0, atol=1e-9)
+    assert len(curve.segments) == 2
+    assert abs(curve(points[500] + 0.5) - expected(points[500] + 0.5)) < 1e-9
+
+    transformed = curves.create_curve_from_file(str(file), 2, 0, 1, chunk_size=64)
+    assert np.allclose(transformed(xs), 2 * expected(xs) + 1, rtol=0, atol=1e-9)
@@ -0,0 +1,57 @@
+import modules.curves as curves
+import modules.export as export
+import matplotlib.pyplot as plt
+import datetime as dt
+import pytest
+
+
+def test_export_figures(tmp_path):
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 4)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.2)
+
+    specs = [
+        export.FigureSpec(
+            "spot_perp_difference",
+            str(tmp_path / "curves.png"),
+            dict(
+                start_date=start,
+                end_date=end,
+                use_spot_curve_2=True,
+                spot_curve_2_starting_value=100,
+                spot_curve_2_relative_change=0.1,
+            ),
+        )
+    ] + [
+        export.FigureSpec(
+            "funding_periods",
+            str(tmp_path / f"funding_{hours}h.png"),
+            dict(
+                start_date=start,
+                end_date=end,
+                spot_curve=spot_curve,
+                perp_curve=perp_curve,
+                funding_payment_frequency=dt.timedelta(hours=hours),
+                spot_sampling_frequency=dt.timedelta(minutes=5),
+                perp_sampling_frequency=dt.timedelta(minutes=5),
+                show_funding_payment=True,
+                show_spot_twap=True,
+            ),
+        )
+        for hours in [8, 24]
+    ]
+
+    figures = plt.get_fignums()
+    interactive = plt.isinteractive()
+    for max_workers in [1, 2]:
+        paths = export.export_figures(specs, max_workers=max_workers)
+        assert paths == [spec.plot_save_path for spec in specs]
+        for path in paths:
+            with open(path, "rb") as f:
+                assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+    assert plt.get_fignums() == figures
+    assert plt.isinteractive() == interactive
+
+    with pytest.raises(ValueError):
+        export.FigureSpec("unknown", str(tmp_path / "unknown.png"), {})
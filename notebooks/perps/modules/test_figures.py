@@ -0,0 +1,54 @@
+import modules.curves as curves
+import modules.figures as figs
+import modules.perps as perps
+import datetime as dt
+import numpy as np
+
+
+def test_iter_funding_data_matches_compute_funding_data():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 4, 5)
+    rng = np.random.default_rng(5)
+    times = np.sort(
+        rng.uniform(perps.to_timestamps(start), perps.to_timestamps(end), 400)
+    )
+    times[0] = perps.to_timestamps(start)
+    spot_curve = curves.StepCurve(times, rng.uniform(90, 110, 400))
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.2)
+    parameters = dict(
+        start_date=start,
+        end_date=end,
+        spot_curve=spot_curve,
+        perp_curve=perp_curve,
+        funding_payment_frequency=dt.timedelta(hours=8),
+        spot_sampling_frequency=dt.timedelta(minutes=7),
+        perp_sampling_frequency=dt.timedelta(minutes=5),
+        interest_rate=0.1,
+        clamp_lower_bound=-0.0005,
+        clamp_upper_bound=0.0005,
+    )
+    expected = figs.compute_funding_data(**parameters)
+
+    steps = list(figs.iter_funding_data(**parameters, step_size=200))
+    assert [done for done, _, _ in steps] == [2, 4, 6, 8, 9]
+    assert all(total == 9 for _, total, _ in steps)
+    for _, _, data in steps:
+        n = len(data.funding_periods)
+        assert np.array_equal(
+            data.funding_periods.end, expected.funding_periods.end[:n]
+        )
+        assert np.allclose(
+            data.funding_periods.payment,
+            expected.funding_periods.payment[:n],
+            rtol=1e-12,
+        )
+        assert np.array_equal(
+            data.spot_points,
+            expected.spot_points[: len(data.spot_points)],
+            equal_nan=True,
+        )
+
+    last = steps[-1][2]
+    assert len(last.funding_periods) == len(expected.funding_periods)
+    assert np.array_equal(last.perp_points, expected.perp_points)
+    assert np.array_equal(last.spot_sampling_schedule, expected.spot_sampling_schedule)
@@ -0,0 +1,117 @@
+import modules.impact as impact
+import modules.perps as perps
+import datetime as dt
+import numpy as np
+import pytest
+
+
+def reference_impact_price(levels, notional):
+    remaining = notional
+    volume = 0
+    for price, size in levels:
+        take = min(remaining, price * size)
+        volume += take / price
+        remaining -= take
+        if remaining <= 0:
+            return notional / volume
+    return np.nan
+
+
+def random_book(rng, mid):
+    n = rng.integers(0, 12)
+    bids = [
+        (mid - 0.5 - i - rng.uniform(0, 0.5), rng.uniform(0.1, 3)) for i in range(n)
+    ]
+    asks = [
+        (mid + 0.5 + i + rng.uniform(0, 0.5), rng.uniform(0.1, 3)) for i in range(n)
+    ]
+    return bids, asks
+
+
+def test_impact_prices_match_level_walk():
+    rng = np.random.default_rng(11)
+    notional = 500
+    engine = impact.ImpactPriceEngine(notional)
+    start = dt.datetime(2023, 5, 1)
+    books = []
+    for i in range(300):
+        bids, asks = random_book(rng, 100 + i * 0.01)
+        books.append((bids, asks))
+        engine.add_snapshot(start + dt.timedelta(seconds=i), bids, asks)
+        if i == 150:
+            # queries in the middle of the stream only process new snapshots later
+            assert len(engine.impact_bid_prices()) == 151
+
+    expected_bids = [reference_impact_price(b, notional) for b, _ in books]
+    expected_asks = [reference_impact_price(a, notional) for _, a in books]
+    assert np.allclose(engine.impact_bid_prices(), expected_bids, equal_nan=True)
+    assert np.allclose(engine.impact_ask_prices(), expected_asks, equal_nan=True)
+    assert np.any(np.isnan(expected_bids)) and not np.all(np.isnan(expected_bids))
+
+    bid_curve = engine.impact_bid_curve()
+    assert np.isnan(bid_curve(start - dt.timedelta(seconds=1)))
+    t = start + dt.timedelta(seconds=10, milliseconds=500)
+    assert bid_curve(t) == pytest.approx(expected_bids[10], nan_ok=True)
+
+    with pytest.raises(ValueError):
+        engine.add_snapshot(start, [], [])
+
+
+def test_impact_curves_feed_premium_index():
+    engine = impact.ImpactPriceEngine(100)
+    start = dt.datetime(2023, 5, 1)
+    for i in range(10):
+        engine.add_snapshot(
+            start + dt.timedelta(minutes=i), [(102, 10)], [(103, 1), (104, 100)]
+        )
+
+    index_curve = lambda x: 100 + 0 * x
+    premium = perps.compute_premium_index(
+        engine.impact_bid_curve(),
+        engine.impact_ask_curve(),
+        index_curve,
+        perps.create_schedule(
+            start, start + dt.timedelta(minutes=10), dt.timedelta(minutes=1)
+        ),
+        start,
+        start + dt.timedelta(minutes=10),
+    )
+    assert premium == pytest.approx(0.02)
+
+
+def test_impact_engine_polled_per_snapshot():
+    rng = np.random.default_rng(12)
+    polled = impact.ImpactPriceEngine(300, capacity=4)
+    batched = impact.ImpactPriceEngine(300)
+    start = dt.datetime(2023, 5, 1)
+    first_curve = None
+    for i in range(100):
+        bids, asks = random_book(rng, 100 + i * 0.01)
+        t = start + dt.timedelta(seconds=i)
+        polled.add_snapshot(t, bids, asks)
+        batched.add_snapshot(t, bids, asks)
+        curve = polled.impact_ask_curve()
+        assert len(curve.times) == len(curve.values) == i + 1
+        if i == 9:
+            first_curve = curve
+
+    # results are views of the grown buffers
+    assert len(polled.times) == 128
+    assert np.shares_memory(polled.impact_ask_prices(), polled.impact["ask"])
+    assert np.shares_memory(curve.times, polled.times)
+
+    assert np.array_equal(polled.timestamps, batched.timestamps)
+    # batches only change the cumulative sums' rounding
+    assert np.allclose(
+        polled.impact_bid_prices(), batched.impact_bid_prices(), equal_nan=True
+    )
+    assert np.allclose(
+        polled.impact_ask_prices(), batched.impact_ask_prices(), equal_nan=True
+    )
+    # curves taken earlier keep their snapshots
+    assert len(first_curve.times) == 10
+    assert np.array_equal(
+        first_curve(start + dt.timedelta(seconds=50)),
+        polled.impact_ask_prices()[9],
+        equal_nan=True,
+    )
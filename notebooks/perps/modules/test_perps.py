@@ -1,5 +1,6 @@
 import modules.perps as perps
 import modules.curves as curves
+import time
 import datetime as dt
 import numpy as np
 import pytest
@@ -149,6 +150,49 @@ def test_compute_funding_payment():
     assert abs(actual - expected) < delta
 
 
+def test_funding_rate_response_matches_scalar_formula():
+    inf = float("inf")
+    spot = 100.0
+    perp = spot * (1 + np.linspace(-0.1, 0.1, 201))
+    r = 0.02
+    for a, b, c, d, k in [
+        (inf, -inf, inf, -inf, 1),
+        (0.05, -0.05, inf, -inf, 1),
+        (0, 0, inf, -inf, 2),
+        (0.05, -0.05, 0.05, -0.05, 2),
+    ]:
+        expected = [
+            min(
+                c,
+                max(
+                    d,
+                    k
+                    * ((f - spot) / spot + min(a, max(b, ((1 + r) * spot - f) / spot))),
+                ),
+            )
+            for f in perp
+        ]
+        actual = perps.funding_rate_response(perp, spot, r, b, a, k, d, c)
+        assert np.allclose(actual, expected, atol=1e-12)
+
+    # (r, a, b) grid against the spot/perp grid in one call
+    rates = np.array([0, 0.02, 0.1])[:, None, None]
+    bounds = np.array([0.0005, 0.05, inf])[None, :, None]
+    surface = perps.funding_rate_response(perp, spot, rates, -bounds, bounds)
+    assert surface.shape == (3, 3, len(perp))
+    assert np.allclose(surface[:, 2, :], rates[:, 0, :] * np.ones(len(perp)))
+
+    premium_index = np.linspace(-0.01, 0.01, 11)
+    expected = [p + min(0.0005, max(-0.0005, (1 + 0.5 * r) - p)) for p in premium_index]
+    actual = perps.compute_funding_rate_from_premium_index(
+        premium_index, r, 0.5, -0.0005, 0.0005
+    )
+    assert np.allclose(actual, expected, atol=1e-15)
+    assert (
+        perps.compute_funding_rate_from_premium_index(0.001, r, 1, -inf, inf) == 1 + r
+    )
+
+
 def test_payment_summarize():
     start = dt.datetime(2019, 1, 1)
     end = dt.datetime(2019, 7, 7)
@@ -183,3 +227,483 @@ def test_payment_summarize():
     assert payment1 + payment2 + payment3 == sum_funding_payments
     assert spot_rate_of_return == spot_end / spot_start - 1
     assert perp_rate_of_return == (perp_end - sum_funding_payments) / perp_start - 1
+
+
+def test_payment_schedule_matches_iterative_construction():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 2, 3, 4, 5)
+    timestep = dt.timedelta(minutes=7, seconds=3)
+
+    expected = [start]
+    while expected[-1] + timestep < end:
+        expected.append(expected[-1] + timestep)
+
+    schedule = perps.create_schedule(start, end, timestep)
+    assert schedule.dtype == np.dtype("datetime64[us]")
+    assert len(schedule) == len(expected)
+    assert np.array_equal(
+        perps.to_timestamps(schedule),
+        [x.replace(tzinfo=dt.timezone.utc).timestamp() for x in expected],
+    )
+
+    schedule = perps.create_schedule(start, end, timestep, include_end_date=True)
+    assert len(schedule) == len(expected) + 1
+    assert schedule[-1] == perps.to_datetime64(end)
+
+    # exact multiples of the time step don't include the end date
+    schedule = perps.create_schedule(start, start + 4 * timestep, timestep)
+    assert len(schedule) == 4
+
+
+@pytest.fixture
+def new_york_timezone(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available")
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_datetime_conversions_ignore_local_timezone(new_york_timezone):
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 3, 7)
+    assert start.timestamp() != 1682899200  # the local timezone is in effect
+
+    assert perps.to_timestamps(start) == 1682899200
+    assert perps.to_datetime64(start) == np.datetime64("2023-05-01T00:00:00")
+    assert perps.to_datetime(perps.to_datetime64(start)) == start
+    assert perps.to_datetime(perps.to_timestamps(start)) == start
+    assert perps.to_timestamps(perps.to_datetime64(end)) == perps.to_timestamps(end)
+
+    aware = dt.datetime(2023, 5, 1, 2, tzinfo=dt.timezone(dt.timedelta(hours=2)))
+    assert perps.to_datetime64(aware) == perps.to_datetime64(start)
+    assert perps.to_timestamps(aware) == perps.to_timestamps(start)
+
+    schedule = perps.create_schedule(start, end, dt.timedelta(hours=8))
+    assert schedule[0] == start
+    assert [perps.to_datetime(x) for x in schedule] == [
+        start + i * dt.timedelta(hours=8) for i in range(7)
+    ]
+
+    curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.5)
+    periods = perps.compute_funding_periods(schedule, schedule, schedule, curve, curve)
+    assert periods[0].start == start
+    assert periods[-1].end == schedule[-1]
+
+
+def test_twap_accepts_datetime64_schedule():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 30)
+    curve = curves.SimpleCurveBetweenDates(start, end, 3.21, -0.6)
+
+    schedule = perps.create_schedule(start, end, dt.timedelta(hours=5))
+    legacy_schedule = np.array([perps.to_datetime(x) for x in schedule])
+
+    for s, e in [
+        (start, end),
+        (start - dt.timedelta(days=3), end),
+        (start + dt.timedelta(days=3, hours=2), end + dt.timedelta(days=1)),
+    ]:
+        assert perps.twap(curve, schedule, s, e) == perps.twap(
+            curve, legacy_schedule, s, e
+        )
+        assert perps.twap(
+            curve, schedule, perps.to_datetime64(s), perps.to_datetime64(e)
+        ) == perps.twap(curve, legacy_schedule, s, e)
+
+
+def reference_twap(curve, times, start, end, weight_multiplier_increment=0):
+    # point-by-point TWAP definition the batch engine must reproduce
+    indices = np.flatnonzero(np.logical_and(times >= start, times < end))
+    if len(indices) == 0:
+        if min(times) > start:
+            return None
+        return curve(times[np.flatnonzero(times <= start)[-1]])
+
+    prev_value = curve(times[indices[0]])
+    if indices[0] == 0:
+        start = times[indices[0]]
+    else:
+        prev_value = curve(times[indices[0] - 1])
+
+    prev_time = start
+    sum_product = 0
+    sum_weight = 0
+    weight_multiplier = 1
+    for t in times[indices][1:]:
+        w = (t - prev_time) * weight_multiplier
+        sum_product += prev_value * w
+        sum_weight += w
+        weight_multiplier += weight_multiplier_increment
+        prev_value = curve(t)
+        prev_time = t
+    w = (end - prev_time) * weight_multiplier
+    sum_product += prev_value * w
+    sum_weight += w
+    return sum_product / sum_weight
+
+
+def test_evaluate_curve():
+    xs = np.array([10.0, 20.0, 30.0])
+    discrete = curves.DiscreteCurve({10.0: 1.0, 20.0: 2.0, 30.0: 4.0})
+    assert not perps.supports_arrays(discrete)
+    assert np.array_equal(perps.evaluate_curve(discrete, xs), [1, 2, 4])
+
+    shifted = curves.TransformedCurve(discrete, 2, horizontal_shift=-10)
+    assert not perps.supports_arrays(curves.SuperimposedCurve(shifted, None))
+    assert np.array_equal(perps.evaluate_curve(shifted, xs[:2]), [4, 8])
+
+    # a constant returned for the whole array is spread over the points
+    assert np.array_equal(perps.evaluate_curve(lambda x: 5.0, xs), [5, 5, 5])
+
+    # errors raised by array curves are not hidden by a point by point retry
+    def broken(xs):
+        raise KeyError("broken")
+
+    with pytest.raises(KeyError):
+        perps.evaluate_curve(broken, xs)
+
+
+def test_compute_twaps_matches_reference():
+    rng = np.random.default_rng(1)
+    times = np.sort(rng.uniform(1000, 2000, 300))
+    values = rng.uniform(50, 150, 300)
+    curve = curves.DiscreteCurve(dict(zip(times, values)))
+
+    boundaries = np.concatenate(
+        ([900, 950, 1000], np.sort(rng.uniform(1000, 2000, 40)), [2000, 2100, 2200])
+    )
+    for inc in [0, 1, 3]:
+        actual = perps.compute_twaps(curve, times, boundaries, inc)
+        for i in range(len(boundaries) - 1):
+            expected = reference_twap(
+                curve, times, boundaries[i], boundaries[i + 1], inc
+            )
+            if expected is None:
+                assert np.isnan(actual[i])
+                assert (
+                    perps.twap(curve, times, boundaries[i], boundaries[i + 1], inc)
+                    is None
+                )
+            else:
+                assert abs(actual[i] - expected) < 1e-9
+                assert (
+                    abs(
+                        perps.twap(curve, times, boundaries[i], boundaries[i + 1], inc)
+                        - expected
+                    )
+                    < 1e-9
+                )
+
+
+def test_compute_funding_periods_skips_periods_before_sampling():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 8)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.2)
+
+    funding_schedule = perps.create_schedule(start, end, dt.timedelta(days=1), True)
+    spot_sampling_schedule = perps.create_schedule(
+        start + dt.timedelta(days=2), end, dt.timedelta(minutes=5)
+    )
+    perp_sampling_schedule = perps.create_schedule(start, end, dt.timedelta(hours=1))
+
+    funding_periods = perps.compute_funding_periods(
+        funding_schedule,
+        spot_sampling_schedule,
+        perp_sampling_schedule,
+        spot_curve,
+        perp_curve,
+    )
+    assert len(funding_periods) == 5
+    assert funding_periods[0].start == start + dt.timedelta(days=2)
+    for fp in funding_periods:
+        spot_twap = perps.twap(spot_curve, spot_sampling_schedule, fp.start, fp.end)
+        perp_twap = perps.twap(perp_curve, perp_sampling_schedule, fp.start, fp.end)
+        assert abs(fp.spot_twap - spot_twap) < 1e-9
+        assert abs(fp.perp_twap - perp_twap) < 1e-9
+        assert abs(fp.payment - (perp_twap - spot_twap)) < 1e-9
+
+
+def test_funding_periods_columns():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 4)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.2)
+    sampling_schedule = perps.create_schedule(start, end, dt.timedelta(minutes=5))
+    funding_periods = perps.compute_funding_periods(
+        perps.create_schedule(start, end, dt.timedelta(hours=8), True),
+        sampling_schedule,
+        sampling_schedule,
+        spot_curve,
+        perp_curve,
+        0.1,
+        -0.0005,
+        0.0005,
+    )
+    assert len(funding_periods) == 9
+
+    rows = list(funding_periods)
+    assert isinstance(rows[0], perps.FundingPeriod)
+    assert np.array_equal(funding_periods.payment, [x.payment for x in rows])
+    assert np.array_equal(funding_periods.start[1:], funding_periods.end[:-1])
+    assert rows[-1].end == perps.to_datetime64(end)
+    # rows keep the datetime attributes of the list based FundingPeriods
+    assert type(rows[0].start) is dt.datetime and rows[0].start == start
+    assert rows[-1].end.strftime("%B %d") == "May 04"
+    assert rows[-1].end - rows[0].start == end - start
+    assert type(rows[0].payment) is float
+    assert np.shares_memory(funding_periods.rate, funding_periods.data)
+
+    copy = perps.FundingPeriods.from_periods(rows)
+    assert np.array_equal(copy.data, funding_periods.data)
+    assert perps.FundingPeriods.from_periods(funding_periods) is funding_periods
+    assert len(funding_periods[funding_periods.payment > 0]) == np.sum(
+        funding_periods.payment > 0
+    )
+
+    df = funding_periods.to_frame()
+    assert list(df.columns) == list(perps.FUNDING_PERIOD_DTYPE.names)
+    assert np.array_equal(df.spot_twap, funding_periods.spot_twap)
+
+    assert perps.summarise(
+        start, end, funding_periods, spot_curve, perp_curve
+    ) == perps.summarise(start, end, rows, spot_curve, perp_curve)
+
+
+def test_funding_frequency_table_matches_summarise():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 11)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, -0.2)
+    funding_frequencies = [dt.timedelta(days=1), dt.timedelta(hours=8)]
+    spot_sampling_frequencies = [dt.timedelta(minutes=20), dt.timedelta(hours=1)]
+    perp_sampling_frequencies = [dt.timedelta(minutes=5), dt.timedelta(minutes=7)]
+
+    table = perps.funding_frequency_table(
+        start,
+        end,
+        spot_curve,
+        perp_curve,
+        funding_frequencies,
+        spot_sampling_frequencies,
+        perp_sampling_frequencies,
+        0.1,
+        -0.0005,
+        0.0005,
+    )
+    assert len(table) == 8
+
+    i = 0
+    for ff in funding_frequencies:
+        for sf in spot_sampling_frequencies:
+            for pf in perp_sampling_frequencies:
+                funding_periods = perps.compute_funding_periods(
+                    perps.create_schedule(start, end, ff),
+                    perps.create_schedule(start, end, sf),
+                    perps.create_schedule(start, end, pf),
+                    spot_curve,
+                    perp_curve,
+                    0.1,
+                    -0.0005,
+                    0.0005,
+                )
+                row = table.iloc[i]
+                assert (row.funding_frequency, row.spot_frequency) == (ff, sf)
+                assert row.perp_frequency == pf
+                assert np.allclose(
+                    [row.spot_rr, row.perp_rr, row.sum_payments],
+                    perps.summarise(
+                        start, end, funding_periods, spot_curve, perp_curve
+                    ),
+                    rtol=1e-12,
+                )
+                i += 1
+
+
+def test_funding_engine_matches_batch_computation():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 3)
+    frequency = dt.timedelta(hours=8)
+    rng = np.random.default_rng(3)
+
+    spot_times = np.sort(
+        rng.uniform(perps.to_timestamps(start) + 3600, perps.to_timestamps(end), 500)
+    )
+    perp_times = np.sort(
+        rng.uniform(perps.to_timestamps(start) - 3600, perps.to_timestamps(end), 300)
+    )
+    spot_values = rng.uniform(90, 110, len(spot_times))
+    perp_values = rng.uniform(90, 110, len(perp_times))
+    spot_curve = curves.DiscreteCurve(dict(zip(spot_times, spot_values)))
+    perp_curve = curves.DiscreteCurve(dict(zip(perp_times, perp_values)))
+    funding_schedule = perps.create_schedule(start, end, frequency, True)
+
+    expected = perps.compute_funding_periods(
+        funding_schedule,
+        spot_times,
+        perp_times,
+        spot_curve,
+        perp_curve,
+        0.1,
+        -0.01,
+        0.01,
+    )
+
+    engine = perps.FundingEngine(start, frequency, 0.1, -0.01, 0.01)
+    actual = []
+    # spot one observation at a time, perp in mini-batches
+    for t, v in zip(spot_times, spot_values):
+        actual.extend(engine.add_spot_observations(t, v))
+    for i in range(0, len(perp_times), 7):
+        actual.extend(
+            engine.add_perp_observations(perp_times[i : i + 7], perp_values[i : i + 7])
+        )
+    actual.extend(engine.advance(end))
+
+    assert len(actual) == len(expected) == 6
+    for a, e in zip(actual, expected):
+        assert a.start == e.start and a.end == e.end
+        assert abs(a.spot_twap - e.spot_twap) < 1e-9
+        assert abs(a.perp_twap - e.perp_twap) < 1e-9
+        assert abs(a.payment - e.payment) < 1e-9
+        assert abs(a.rate - e.rate) < 1e-12
+
+    with pytest.raises(ValueError):
+        engine.add_spot_observations(spot_times[0], 1)
+
+
+def test_funding_engine_weighting():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 2)
+    frequency = dt.timedelta(hours=6)
+    rng = np.random.default_rng(4)
+    times = np.sort(
+        rng.uniform(perps.to_timestamps(start) + 7200, perps.to_timestamps(end), 200)
+    )
+    values = rng.uniform(90, 110, len(times))
+    funding_schedule = perps.create_schedule(start, end, frequency, True)
+
+    engine = perps.FundingEngine(start, frequency, weight_multiplier_increment=2)
+    funding_periods = engine.add_spot_observations(times, values)
+    funding_periods += engine.add_perp_observations(times, values)
+    funding_periods += engine.advance(end)
+
+    expected = perps.twaps_from_samples(
+        times,
+        values,
+        perps.to_timestamps(funding_schedule[:-1]),
+        perps.to_timestamps(funding_schedule[1:]),
+        2,
+    )
+    assert len(funding_periods) == len(expected)
+    for fp, twap in zip(funding_periods, expected):
+        assert abs(fp.spot_twap - twap) < 1e-9
+        assert fp.payment == 0
+
+
+def test_sweep_funding_payments():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 15)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.3)
+    perp_curve = curves.SimpleCurveBetweenDates(start, end, 102, 0.1)
+    funding_schedule = perps.create_schedule(start, end, dt.timedelta(days=2), True)
+    spot_sampling_schedules = {
+        f: perps.create_schedule(start, end, dt.timedelta(minutes=f)) for f in [5, 60]
+    }
+    perp_sampling_schedules = {
+        f: perps.create_schedule(start, end, dt.timedelta(minutes=f))
+        for f in [1, 30, 240]
+    }
+    interest_rates = [0, 0.05]
+    lower_bounds = [0, -0.0005, -0.01]
+    upper_bounds = [0, 0.0005]
+
+    df = perps.sweep_funding_payments(
+        funding_schedule,
+        spot_curve,
+        perp_curve,
+        spot_sampling_schedules,
+        perp_sampling_schedules,
+        interest_rates,
+        lower_bounds,
+        upper_bounds,
+    )
+    assert df.shape == (7, 2 * 2 * 3 * 2 * 3 * 2)
+
+    for sf in spot_sampling_schedules:
+        for pf in perp_sampling_schedules:
+            for r in interest_rates:
+                for lb in lower_bounds:
+                    for ub in upper_bounds:
+                        expected = perps.compute_funding_periods(
+                            funding_schedule,
+                            spot_sampling_schedules[sf],
+                            perp_sampling_schedules[pf],
+                            spot_curve,
+                            perp_curve,
+                            r,
+                            lb,
+                            ub,
+                        )
+                        payments = df["payment"][sf, pf, r, lb, ub]
+                        rates = df["rate"][sf, pf, r, lb, ub]
+                        assert np.allclose(
+                            payments, [x.payment for x in expected], atol=1e-9
+                        )
+                        assert np.allclose(
+                            rates, [x.rate for x in expected], atol=1e-12
+                        )
+
+
+def test_premium_index():
+    assert perps.premium_index(101, 103, 100) == 0.01
+    assert perps.premium_index(97, 98, 100) == -0.02
+    assert perps.premium_index(99, 101, 100) == 0
+    assert np.allclose(
+        perps.premium_index(np.array([101, 97, 99]), np.array([103, 98, 101]), 100),
+        [0.01, -0.02, 0],
+    )
+
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 3)
+    price_index_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    impact_bid_curve = curves.SimpleCurveBetweenDates(start, end, 99, 0.2)
+    impact_ask_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.15)
+    premium_curve = lambda x: perps.premium_index_at_point(
+        impact_bid_curve, impact_ask_curve, price_index_curve, x
+    )
+
+    schedule = perps.create_schedule(
+        start + dt.timedelta(hours=1), end, dt.timedelta(minutes=7)
+    )
+    funding_schedule = perps.create_schedule(start, end, dt.timedelta(hours=8), True)
+    times = perps.to_timestamps(schedule)
+    boundaries = perps.to_timestamps(funding_schedule)
+
+    for inc in [0, 1]:
+        actual = perps.compute_premium_indices(
+            impact_bid_curve,
+            impact_ask_curve,
+            price_index_curve,
+            schedule,
+            funding_schedule,
+            inc,
+        )
+        for i in range(len(boundaries) - 1):
+            expected = reference_twap(
+                premium_curve, times, boundaries[i], boundaries[i + 1], inc
+            )
+            assert abs(actual[i] - expected) < 1e-12
+            single = perps.compute_premium_index(
+                impact_bid_curve,
+                impact_ask_curve,
+                price_index_curve,
+                schedule,
+                funding_schedule[i],
+                funding_schedule[i + 1],
+                inc,
+            )
+            assert abs(single - expected) < 1e-12
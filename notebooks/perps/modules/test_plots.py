@@ -0,0 +1,78 @@
+import modules.curves as curves
+import modules.perps as perps
+import modules.plots as plots
+from matplotlib.figure import Figure
+import datetime as dt
+import numpy as np
+
+
+def test_window_keeps_neighbours_outside_the_limits():
+    start = dt.datetime(2023, 5, 1)
+    xs = perps.create_schedule(
+        start, start + dt.timedelta(hours=10), dt.timedelta(hours=1)
+    )
+    ys = np.arange(10.0)
+
+    wxs, wys = plots.window(
+        xs, ys, start + dt.timedelta(hours=2, minutes=30), start + dt.timedelta(hours=5)
+    )
+    assert np.array_equal(wys, [2, 3, 4, 5, 6])
+    assert np.array_equal(wxs, xs[2:7])
+    assert np.array_equal(plots.window(xs, ys)[1], ys)
+    assert np.array_equal(plots.window(xs, ys, right=start)[1], [0, 1])
+
+
+def test_plot_funding_periods_decimates_the_zoomed_window():
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 11)
+    spot_curve = curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    perp_curve = curves.TransformedCurve(
+        lambda x: np.sin(np.asarray(x) / 600), 5, vertical_shift=101
+    )
+    funding_schedule = perps.create_schedule(
+        start, end, dt.timedelta(hours=8), include_end_date=True
+    )
+    sampling_schedule = perps.create_schedule(start, end, dt.timedelta(seconds=30))
+    funding_periods = perps.compute_funding_periods(
+        funding_schedule, sampling_schedule, sampling_schedule, spot_curve, perp_curve
+    )
+
+    def plot(left, right):
+        figure = Figure(figsize=(15, 5))
+        ax = figure.add_subplot()
+        plots.plot_funding_periods(
+            ax,
+            start,
+            end,
+            funding_periods,
+            sampling_schedule,
+            sampling_schedule,
+            spot_curve,
+            perp_curve,
+            x_limit_left=left,
+            x_limit_right=right,
+            show_perp_points=True,
+            show_perp_step=True,
+        )
+        buckets = int(np.ceil(ax.get_window_extent().width))
+        markers, step = [line.get_xydata() for line in ax.get_lines()[:2]]
+        return buckets, markers, step
+
+    # the whole range has too many samples for one marker each
+    buckets, markers, step = plot(None, None)
+    assert len(markers) <= plots.MAX_MARKERS
+    assert len(step) <= 2 * buckets + 2
+
+    # a zoomed view gets its full pixel width of detail and every sample as a marker
+    left = start + dt.timedelta(days=2)
+    right = left + dt.timedelta(days=2)
+    buckets, markers, step = plot(left, right)
+    in_view = (sampling_schedule >= perps.to_datetime64(left)) & (
+        sampling_schedule <= perps.to_datetime64(right)
+    )
+    assert len(markers) == np.count_nonzero(in_view) + 2
+    expected = perps.evaluate_curve(
+        perp_curve, perps.to_timestamps(sampling_schedule[in_view])
+    )
+    assert np.allclose(markers[1:-1, 1], expected)
+    assert 1.5 * buckets < len(step) <= 2 * buckets + 2
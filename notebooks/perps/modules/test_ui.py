@@ -0,0 +1,130 @@
+import modules.curves as curves
+import numpy as np
+import modules.ui as ui
+import datetime as dt
+import threading
+import queue
+
+
+def test_funding_job_keeps_display_changes_for_the_same_key():
+    job = ui.FundingJob(("curves", 1), {"zoom": None})
+    zoomed = {"zoom": (0.1, 0.2)}
+    assert job.update(("curves", 1), zoomed)
+    assert job.plot_parameters is zoomed
+
+    # a different computation needs a new job
+    assert not job.update(("curves", 2), {"zoom": None})
+    assert job.plot_parameters is zoomed
+
+    # a display change arriving while drawing is drawn before the job finishes
+    drawn = job.plot_parameters
+    assert job.update(("curves", 1), {"zoom": (0.3, 0.4)})
+    assert not job.finish(drawn)
+    assert job.finish(job.plot_parameters)
+    assert not job.update(("curves", 1), zoomed)
+
+    cancelled = ui.FundingJob(("curves", 1), {"zoom": None})
+    cancelled.cancelled.set()
+    assert not cancelled.update(("curves", 1), zoomed)
+
+
+class GatedCurve:
+    """A flat curve whose evaluation waits for the gate to open."""
+
+    supports_arrays = True
+
+    def __init__(self, value, gate):
+        self.value = value
+        self.gate = gate
+        self.calls = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        self.gate.wait()
+        return np.full(np.shape(x), self.value, dtype=float)
+
+
+def create_funding_ui(tmp_path, calls, spot_curve=None):
+    start = dt.datetime(2023, 5, 1)
+    end = dt.datetime(2023, 5, 4)
+    u = ui.UI(
+        str(tmp_path),
+        start,
+        end,
+        redraw_interval=0,
+        dispatch=lambda function, *args: calls.put((function, args)),
+    )
+    u.spot_curve = spot_curve or curves.SimpleCurveBetweenDates(start, end, 100, 0.1)
+    u.perp_curve = curves.SimpleCurveBetweenDates(start, end, 101, 0.05)
+
+    # every widget update is recorded with the thread it happened on
+    updates = []
+    for widget in [u.funding_progress, u.funding_status, u.funding_chart]:
+        widget.observe(
+            lambda change: updates.append((change, threading.current_thread())),
+            names="value",
+        )
+    return u, updates
+
+
+def run_dispatched(calls, job):
+    # the test thread stands in for the kernel, running what the job dispatches
+    while not (job.finished and calls.empty()):
+        try:
+            function, args = calls.get(timeout=10)
+        except queue.Empty:
+            raise AssertionError("the funding job stalled")
+        function(*args)
+
+
+def test_funding_job_runs_to_completion(tmp_path):
+    calls = queue.Queue()
+    u, updates = create_funding_ui(tmp_path, calls)
+    controls, chart = u.get_funding_elements()
+    job = u.funding_job
+    assert job is not None
+    run_dispatched(calls, job)
+
+    # 3 days of 8 hour periods
+    assert u.funding_status.value == "8/8 periods"
+    assert u.funding_progress.value == u.funding_progress.max == 8
+    assert bytes(u.funding_chart.value).startswith(b"\x89PNG")
+    assert u.funding_cache.find(job.key) is not None
+    assert updates
+    assert all(thread is threading.main_thread() for _, thread in updates)
+
+
+def test_funding_job_cancelled_by_a_new_computation(tmp_path):
+    calls = queue.Queue()
+    gate = threading.Event()
+    spot_curve = GatedCurve(100, gate)
+    u, updates = create_funding_ui(tmp_path, calls, spot_curve)
+    controls, chart = u.get_funding_elements()
+    first = u.funding_job
+
+    # a new interest rate needs new funding data, cancelling the first job while
+    # it is evaluating the spot curve
+    interest_rate = controls.children[2].children[0]
+    interest_rate.value = 0.1
+    second = u.funding_job
+    assert second is not first
+    assert first.cancelled.is_set()
+    assert not second.cancelled.is_set()
+    gate.set()
+
+    run_dispatched(calls, first)
+    run_dispatched(calls, second)
+    assert u.funding_cache.find(first.key) is None
+    assert u.funding_cache.find(second.key) is not None
+    assert u.funding_status.value == "8/8 periods"
+    # neither the first job's progress nor its chart reached the widgets
+    assert [
+        change["new"] for change, _ in updates if change["owner"] is u.funding_status
+    ] == ["computing", "8/8 periods"]
+    assert all(thread is threading.main_thread() for _, thread in updates)
+
+    # the chart shows the second job's data
+    rendered = u.render_funding_data(
+        u.funding_cache.find(second.key), second.plot_parameters
+    )
+    assert u.funding_chart.value == rendered
@@ -1,19 +1,130 @@
+import io
+import os
+import asyncio
+import time
+import threading
 import datetime as dt
 import modules.curves as curves
 import ipywidgets as widgets
 import modules.figures as figs
 import glob
+from collections import OrderedDict
+from matplotlib.figure import Figure
+
+
+def file_mtime(path):
+    return os.path.getmtime(path) if path else None
+
+
+def kernel_dispatcher():
+    """
+    Calls functions on the thread of the running event loop, i.e. the kernel's when
+    created from a notebook cell, as widgets must only be updated from there. Without
+    a running loop (outside a kernel) functions are called directly.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return lambda function, *args: function(*args)
+    return loop.call_soon_threadsafe
+
+
+class LRUCache:
+    """Bounded cache of computed values, evicting the least recently used one."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # values are also added from background computations
+        self.lock = threading.Lock()
+
+    def find(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get(self, key, compute):
+        value = self.find(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+
+class FundingJob:
+    """
+    Funding data computed in the background for a key, drawn with the latest plot parameters
+    given until it finishes.
+    """
+
+    def __init__(self, key, plot_parameters: dict):
+        self.key = key
+        self.plot_parameters = plot_parameters
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def update(self, key, plot_parameters: dict) -> bool:
+        """Takes the new plot parameters when still computing the same key."""
+        with self.lock:
+            if self.finished or self.cancelled.is_set() or key != self.key:
+                return False
+            self.plot_parameters = plot_parameters
+            return True
+
+    def finish(self, plot_parameters: dict = None) -> bool:
+        """Marks the job finished unless the plot parameters changed since the given ones."""
+        with self.lock:
+            if (
+                plot_parameters is not None
+                and plot_parameters is not self.plot_parameters
+            ):
+                return False
+            self.finished = True
+            return True
 
 
 class UI:
     def __init__(
-        self, curve_folder_path: str, start_date: dt.datetime, end_date: dt.datetime
+        self,
+        curve_folder_path: str,
+        start_date: dt.datetime,
+        end_date: dt.datetime,
+        cache_size: int = 16,
+        redraw_interval: float = 0.5,
+        dispatch=None,
     ):
         self.curve_folder_path = curve_folder_path
         self.start_date = start_date
         self.end_date = end_date
         self.spot_curve = curves.create_simple_curve(start_date, end_date, 0, 0)
         self.perp_curve = curves.create_simple_curve(start_date, end_date, 0, 0)
+        # curves are cached on their parameters and funding data on the curve
+        # parameters plus the funding parameters, so display-only changes just redraw
+        self.curve_key = None
+        self.curve_cache = LRUCache(cache_size)
+        self.funding_cache = LRUCache(cache_size)
+        # funding data is computed in a background thread which renders the chart (at most
+        # every redraw_interval seconds) as periods complete, a new request cancels it. The
+        # thread only produces data and images, the widgets are updated through dispatch
+        # on the kernel thread
+        self.redraw_interval = redraw_interval
+        self.dispatch = dispatch if dispatch is not None else kernel_dispatcher()
+        self.funding_job = None
+        self.funding_progress = widgets.IntProgress(
+            value=0, min=0, max=1, description="periods"
+        )
+        self.funding_status = widgets.Label()
+        self.funding_chart = widgets.Image(format="png")
 
     def display_funding_periods(
         self,
@@ -35,26 +146,30 @@ class UI:
         show_perp_points: bool = False,
         zoom=None,
     ):
-        figs.funding_periods(
+        funding_payment_frequency = (
+            dt.datetime.combine(dt.date.min, funding_payment_frequency)
+            - dt.datetime.min
+        )
+        spot_sampling_frequency = (
+            dt.datetime.combine(dt.date.min, spot_sampling_frequency) - dt.datetime.min
+        )
+        perp_sampling_frequency = (
+            dt.datetime.combine(dt.date.min, perp_sampling_frequency) - dt.datetime.min
+        )
+        key = (
+            self.curve_key,
+            start_date,
+            end_date,
+            funding_payment_frequency,
+            spot_sampling_frequency,
+            perp_sampling_frequency,
+            interest_rate,
+            clamp_lower_bound,
+            clamp_upper_bound,
+        )
+        plot_parameters = dict(
             start_date=start_date,
             end_date=end_date,
-            spot_curve=self.spot_curve,
-            perp_curve=self.perp_curve,
-            funding_payment_frequency=dt.datetime.combine(
-                dt.date.min, funding_payment_frequency
-            )
-            - dt.datetime.min,
-            spot_sampling_frequency=dt.datetime.combine(
-                dt.date.min, spot_sampling_frequency
-            )
-            - dt.datetime.min,
-            perp_sampling_frequency=dt.datetime.combine(
-                dt.date.min, perp_sampling_frequency
-            )
-            - dt.datetime.min,
-            interest_rate=interest_rate,
-            clamp_lower_bound=clamp_lower_bound,
-            clamp_upper_bound=clamp_upper_bound,
             show_funding_payment=show_funding_payment,
             show_funding_rate=show_funding_rate,
             show_spot_twap=show_spot_twap,
@@ -64,10 +179,112 @@ class UI:
             show_spot_points=show_spot_points,
             show_perp_points=show_perp_points,
             zoom=zoom,
-            show=True,
-            plot_save_path=None,
         )
 
+        job = self.funding_job
+        if job is not None and job.update(key, plot_parameters):
+            # the same data is still being computed, it is drawn with the new settings
+            return
+        if job is not None:
+            job.cancelled.set()
+            self.funding_job = None
+
+        data = self.funding_cache.find(key)
+        if data is not None:
+            self.funding_chart.value = self.render_funding_data(data, plot_parameters)
+            return
+
+        job = FundingJob(key, plot_parameters)
+        self.funding_job = job
+        threading.Thread(
+            target=self.compute_funding_data,
+            args=(
+                job,
+                dict(
+                    start_date=start_date,
+                    end_date=end_date,
+                    spot_curve=self.spot_curve,
+                    perp_curve=self.perp_curve,
+                    funding_payment_frequency=funding_payment_frequency,
+                    spot_sampling_frequency=spot_sampling_frequency,
+                    perp_sampling_frequency=perp_sampling_frequency,
+                    interest_rate=interest_rate,
+                    clamp_lower_bound=clamp_lower_bound,
+                    clamp_upper_bound=clamp_upper_bound,
+                ),
+            ),
+            daemon=True,
+        ).start()
+
+    def compute_funding_data(self, job, parameters):
+        # runs in the background thread, widgets are only touched through dispatch
+        cancelled = job.cancelled
+        try:
+            self.dispatch(self.show_funding_progress, job, 0, 0, "computing")
+            last_drawn = time.monotonic()
+            data = None
+            for done, total, data in figs.iter_funding_data(
+                **parameters, cancelled=cancelled
+            ):
+                if cancelled.is_set():
+                    return
+                self.dispatch(
+                    self.show_funding_progress,
+                    job,
+                    done,
+                    total,
+                    f"{done}/{total} periods",
+                )
+                if (
+                    done < total
+                    and time.monotonic() - last_drawn > self.redraw_interval
+                ):
+                    png = self.render_funding_data(data, job.plot_parameters)
+                    self.dispatch(self.show_funding_chart, job, png)
+                    last_drawn = time.monotonic()
+            if cancelled.is_set():
+                return
+            if data is None:
+                self.dispatch(
+                    self.show_funding_progress, job, 0, 0, "no funding periods"
+                )
+                return
+            self.funding_cache.put(job.key, data)
+            # rendered again until no display change arrived while rendering
+            while True:
+                plot_parameters = job.plot_parameters
+                png = self.render_funding_data(data, plot_parameters)
+                self.dispatch(self.show_funding_chart, job, png)
+                if job.finish(plot_parameters):
+                    return
+        except Exception as e:
+            if not cancelled.is_set():
+                self.dispatch(self.show_funding_progress, job, 0, 0, f"error: {e}")
+        finally:
+            job.finish()
+
+    def show_funding_progress(self, job, done, total, status):
+        # on the kernel thread, where jobs are cancelled, so a cancelled job's
+        # updates are dropped instead of replacing a newer job's
+        if job.cancelled.is_set():
+            return
+        if total > 0:
+            self.funding_progress.max = total
+            self.funding_progress.value = done
+        self.funding_status.value = status
+
+    def show_funding_chart(self, job, png):
+        if not job.cancelled.is_set():
+            self.funding_chart.value = png
+
+    def render_funding_data(self, data, plot_parameters):
+        # drawn on a standalone figure as pyplot is not thread safe
+        figure = Figure(figsize=(15, 5))
+        figs.plot_funding_data(data, **plot_parameters, figure=figure)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+
     def display_curves(
         self,
         start_date: dt.datetime,
@@ -89,7 +306,7 @@ class UI:
         perp_curve_2_starting_value: float,
         perp_curve_2_relative_change: float,
     ):
-        self.spot_curve, self.perp_curve = figs.spot_perp_difference(
+        parameters = dict(
             start_date=start_date,
             end_date=end_date,
             use_spot_curve_1=use_spot_curve_1,
@@ -108,6 +325,21 @@ class UI:
             perp_curve_1_vertical_shift=perp_curve_1_vertical_shift,
             perp_curve_2_starting_value=perp_curve_2_starting_value,
             perp_curve_2_relative_change=perp_curve_2_relative_change,
+        )
+        # edited data files give new curves, as in curves.load_grid_curve
+        key = tuple(parameters.values()) + (
+            file_mtime(spot_curve_1_path) if use_spot_curve_1 else None,
+            file_mtime(perp_curve_1_path) if use_perp_curve_1 else None,
+        )
+        self.spot_curve, self.perp_curve = self.curve_cache.get(
+            key, lambda: figs.create_curves(**parameters)
+        )
+        self.curve_key = key
+        figs.plot_curves(
+            start_date,
+            end_date,
+            self.spot_curve,
+            self.perp_curve,
             show=True,
             plot_save_path=None,
         )
@@ -123,7 +355,7 @@ class UI:
 
         spot_base_cb = widgets.Checkbox(value=True, description="Spot: use base curve")
         spot_base_path = widgets.Select(
-            options=sorted(glob.glob("{}/*".format(self.curve_folder_path)))
+            options=sorted(glob.glob("{}/*.csv".format(self.curve_folder_path)))
         )
 
         spot_slider_mult = widgets.FloatSlider(
@@ -133,6 +365,7 @@ class UI:
             step=0.1,
             description="base: scaling",
             style=slider_style,
+            continuous_update=False,
         )
         spot_slider_h_shift = widgets.FloatSlider(
             value=0,
@@ -141,6 +374,7 @@ class UI:
             step=0.1,
             description="base: h. shift",
             style=slider_style,
+            continuous_update=False,
         )
         spot_slider_v_shift = widgets.FloatSlider(
             value=0,
@@ -149,6 +383,7 @@ class UI:
             step=0.1,
             description="base: v. shift",
             style=slider_style,
+            continuous_update=False,
         )
 
         spot_super_cb = widgets.Checkbox(
@@ -162,6 +397,7 @@ class UI:
             step=0.1,
             description="initial value",
             style=slider_style,
+            continuous_update=False,
         )
 
         spot_slider_super_change = widgets.FloatSlider(
@@ -172,6 +408,7 @@ class UI:
             description="change over period",
             readout_format=".1%",
             style=slider_style,
+            continuous_update=False,
         )
 
         spot_column = widgets.VBox(
@@ -190,7 +427,7 @@ class UI:
         perp_base_cb = widgets.Checkbox(value=True, description="Perps: use base curve")
 
         perp_base_path = widgets.Select(
-            options=sorted(glob.glob("{}/*".format(self.curve_folder_path)))
+            options=sorted(glob.glob("{}/*.csv".format(self.curve_folder_path)))
         )
 
         perp_slider_mult = widgets.FloatSlider(
@@ -200,6 +437,7 @@ class UI:
             step=0.1,
             description="base: scaling",
             style=slider_style,
+            continuous_update=False,
         )
 
         perp_slider_h_shift = widgets.FloatSlider(
@@ -209,6 +447,7 @@ class UI:
             step=0.1,
             description="base: h. shift",
             style=slider_style,
+            continuous_update=False,
         )
 
         perp_slider_v_shift = widgets.FloatSlider(
@@ -218,6 +457,7 @@ class UI:
             step=0.1,
             description="base: v. shift",
             style=slider_style,
+            continuous_update=False,
         )
 
         perp_super_cb = widgets.Checkbox(
@@ -231,6 +471,7 @@ class UI:
             step=0.1,
             description="initial value",
             style=slider_style,
+            continuous_update=False,
         )
 
         perp_slider_super_change = widgets.FloatSlider(
@@ -241,6 +482,7 @@ class UI:
             description="change over period",
             readout_format=".1%",
             style=slider_style,
+            continuous_update=False,
         )
 
         perp_column = widgets.VBox(
@@ -353,9 +595,16 @@ class UI:
             readout_format=".0%",
             style={"description_width": "200px"},
             layout=widgets.Layout(width="50%"),
+            continuous_update=False,
         )
         controls = widgets.VBox(
-            [frequency_sliders, checkboxes, clamp_inputs, zoom_slider]
+            [
+                frequency_sliders,
+                checkboxes,
+                clamp_inputs,
+                zoom_slider,
+                widgets.HBox([self.funding_progress, self.funding_status]),
+            ]
         )
 
         output = widgets.interactive_output(
@@ -381,4 +630,4 @@ class UI:
             },
         )
 
-        return controls, output
+        return controls, widgets.VBox([self.funding_chart, output])